@@ -1,8 +1,223 @@
+import argparse
+import contextlib
+import io
+import os
 import sys
 
-from src.parser import Parser
-from src.typecheck import TypeChecker
+from src.tokens import AzorError
 from src.evaluate import Interpreter
+from src.program import Program, compile, compile_file
+from src.parallel import ParallelInterpreter, DEFAULT_MIN_COST
+from src.lazy import LazyInterpreter
+from src.hashcons import InterningInterpreter
+from src.tiered import TieredInterpreter, DEFAULT_TIER_THRESHOLD
+from src.sampler import SamplingInterpreter, DEFAULT_SAMPLE_RATE, profile
+from src.arith import Arithmetic, MODES, BIGINT
+from src.governor import Limits
+from src.stats import Stats
+from src.monomorphize import DEFAULT_MAX_SPECIALIZATIONS
+from src.modules import is_qualified
+from src.coverage import CoverageInterpreter, FORMATS as COVERAGE_FORMATS, LISTING, write_coverage
+from src.runcache import RunCache, Tee, run_inputs, run_key
+
+# when set, stats are written to this file as if by --stats
+STATS_ENV_VAR = "AZOR_STATS"
+
+
+def parse_args(argv):
+    argparser = argparse.ArgumentParser(prog="azor.py", description="Run an Azor program.")
+    argparser.add_argument("azor_file")
+    argparser.add_argument("args", nargs=argparse.REMAINDER, help="arguments passed to main")
+    mode = argparser.add_mutually_exclusive_group()
+    mode.add_argument("--parallel", action="store_true",
+                      help="evaluate expensive independent pure subexpressions in a process pool")
+    mode.add_argument("--lazy", action="store_true",
+                      help="evaluate pure let bindings and list tails only when they are used")
+    mode.add_argument("--intern", action="store_true",
+                      help="share the storage of identical lists")
+    mode.add_argument("--tiered", action="store_true",
+                      help="compile functions to Python closures once they have been called often enough")
+    argparser.add_argument("--tier-threshold", type=int, default=DEFAULT_TIER_THRESHOLD,
+                           help="calls of a function after which --tiered compiles it")
+    argparser.add_argument("--no-native", action="store_true",
+                           help="run the Azor definitions of stdlib functions instead of native implementations")
+    argparser.add_argument("--arithmetic", choices=MODES, default=BIGINT,
+                           help="integer semantics: unbounded, or 64-bit with wraparound or overflow errors")
+    argparser.add_argument("--max-pow-bits", type=int, default=None,
+                           help="raise an error rather than compute a ** result which could be larger than this "
+                                "many bits")
+    argparser.add_argument("--max-steps", type=int, default=None,
+                           help="stop with an error after evaluating this many expressions")
+    argparser.add_argument("--max-depth", type=int, default=None,
+                           help="stop with an error when calls nest deeper than this")
+    argparser.add_argument("--max-cells", type=int, default=None,
+                           help="stop with an error after allocating this many list cells")
+    argparser.add_argument("--timeout", type=float, default=None,
+                           help="stop with an error after this many seconds")
+    argparser.add_argument("--workers", type=int, default=None,
+                           help="number of worker processes for --parallel (default: CPU count)")
+    argparser.add_argument("--parallel-min-cost", type=float, default=DEFAULT_MIN_COST,
+                           help="smallest estimated subexpression cost worth evaluating in parallel")
+    argparser.add_argument("--parallel-depth", type=int, default=None,
+                           help="maximum nesting of parallel forks before falling back to sequential")
+    argparser.add_argument("--profile", metavar="FILE", default=None,
+                           help="sample the Azor call stack and write it to FILE in collapsed flamegraph format")
+    argparser.add_argument("--profile-rate", type=float, default=DEFAULT_SAMPLE_RATE,
+                           help="samples per second taken by --profile")
+    argparser.add_argument("--parse-workers", type=int, default=None,
+                           help="number of processes used to parse large programs (default: CPU count)")
+    argparser.add_argument("--check-all", action="store_true",
+                           help="typecheck every declaration, not just those main can reach")
+    argparser.add_argument("--max-specializations", type=int, default=DEFAULT_MAX_SPECIALIZATIONS,
+                           help="most copies of generic functions to specialize to the types they are used at")
+    argparser.add_argument("--no-fuse", action="store_true",
+                           help="build the intermediate lists of chained map, filter and fold calls")
+    argparser.add_argument("--no-cse", action="store_true",
+                           help="evaluate pure calls repeated within a function each time, rather than once")
+    argparser.add_argument("--report-fusion", action="store_true",
+                           help="list the calls evaluated as a single fused traversal on stderr")
+    argparser.add_argument("--no-constant-cache", action="store_true",
+                           help="compute pure constants afresh rather than loading the values saved by earlier runs")
+    argparser.add_argument("--cache-run", action="store_true",
+                           help="replay the output and exit code of an earlier run with the same program, arguments "
+                                "and stdin, if the program can't reach rand (reads all of stdin before running)")
+    argparser.add_argument("--stats", metavar="FILE", default=os.environ.get(STATS_ENV_VAR),
+                           help="write phase timings and counters as JSON to FILE, or to stderr if FILE is - "
+                                f"(default: the {STATS_ENV_VAR} environment variable)")
+    argparser.add_argument("--coverage", metavar="FILE", default=None,
+                           help="count evaluations of each line of the program and write them to FILE")
+    argparser.add_argument("--coverage-format", choices=COVERAGE_FORMATS, default=LISTING,
+                           help="write --coverage as an annotated source listing or an lcov tracefile")
+    options = argparser.parse_args(argv)
+    if options.profile is not None and (options.parallel or options.lazy or options.intern or options.tiered):
+        argparser.error("--profile can't be combined with --parallel, --lazy, --intern or --tiered")
+    if options.coverage is not None and (options.parallel or options.lazy or options.intern or options.tiered
+                                         or options.profile):
+        argparser.error("--coverage can't be combined with --parallel, --lazy, --intern, --tiered or --profile")
+    if options.cache_run and (options.profile is not None or options.coverage is not None):
+        argparser.error("--cache-run can't be combined with --profile or --coverage")
+    return options
+
+
+def run(options, stats: Stats):
+    program = compile_file(options.azor_file, stats=stats, workers=options.parse_workers,
+                           prune=not options.check_all, max_specializations=options.max_specializations,
+                           cache_constants=not options.no_constant_cache, cse=not options.no_cse)
+
+    arithmetic = Arithmetic(options.arithmetic, options.max_pow_bits)
+    limits = Limits(
+        max_steps=options.max_steps,
+        max_depth=options.max_depth,
+        max_cells=options.max_cells,
+        timeout=options.timeout,
+    )
+
+    run_cache, key, stdin = None, None, None
+    if options.cache_run:
+        uses_rand, reads_input = run_inputs(program.stmts)
+        if not uses_rand:
+            stdin = sys.stdin.read() if reads_input else None
+            settings = (options.arithmetic, options.max_pow_bits, options.max_steps, options.max_depth,
+                        options.max_cells)
+            run_cache = RunCache(options.azor_file)
+            key = run_key(program.stmts, options.args, stdin, settings)
+            cached = run_cache.get(key)
+            if cached is not None:
+                stats.count("run_cache_hits", 1)
+                exit_code, output = cached
+                sys.stdout.write(output)
+                return exit_code
+
+    natives = {} if options.no_native else program.natives(arithmetic)
+    fused_calls = {} if options.no_fuse else program.fused_calls
+    if options.report_fusion:
+        for fused in fused_calls.values():
+            print(f"{options.azor_file}:{fused.describe()}", file=sys.stderr)
+
+    if options.parallel:
+        interpreter = ParallelInterpreter(
+            program.stmts,
+            natives=natives,
+            arithmetic=arithmetic,
+            workers=options.workers,
+            min_cost=options.parallel_min_cost,
+            limits=limits,
+            fork_depth=options.parallel_depth,
+        )
+    elif options.lazy:
+        interpreter = LazyInterpreter(program.stmts, arithmetic, limits)
+    elif options.intern:
+        interpreter = InterningInterpreter(program.stmts, natives, arithmetic, limits,
+                                           unboxed_lets=program.unboxed_lets)
+    elif options.tiered:
+        interpreter = TieredInterpreter(program.stmts, natives, arithmetic, limits, unboxed_lets=program.unboxed_lets,
+                                        fused_calls=fused_calls, threshold=options.tier_threshold)
+    elif options.profile is not None:
+        interpreter = SamplingInterpreter(program.stmts, natives, arithmetic, limits,
+                                          unboxed_lets=program.unboxed_lets)
+    elif options.coverage is not None:
+        interpreter = CoverageInterpreter(program.stmts, natives, arithmetic, limits,
+                                          unboxed_lets=program.unboxed_lets)
+    else:
+        interpreter = Interpreter(program.stmts, natives, arithmetic, limits, unboxed_lets=program.unboxed_lets,
+                                  fused_calls=fused_calls)
+
+    # The other modes represent values differently, or count their evaluation, so they compute constants themselves,
+    # as do runs whose limits count the work computing them takes
+    share_constants = not (options.parallel or options.lazy or options.intern or options.coverage is not None
+                           or limits.counts_work())
+    if share_constants:
+        constants = program.shared_constants(arithmetic)
+        interpreter.symbol_table.update(constants)
+        stats.count("constants_loaded", len(constants))
+
+    try:
+        with stats.phase("run"):
+            if options.profile is not None:
+                return profile(interpreter, options.args, options.profile, options.profile_rate)
+            if run_cache is not None:
+                return cached_main(interpreter, options.args, run_cache, key, stdin)
+            return interpreter.main(options.args)
+    finally:
+        stats.record_run(interpreter)
+        if share_constants:
+            program.save_constants(interpreter)
+        if options.tiered:
+            stats.count("compiled_functions", len(interpreter.compiled))
+        if options.coverage is not None:
+            # only the declarations from the program's own file, since the listing is of that file
+            stdlib_labels = set(program.stdlib_labels)
+            origins = [program.specializations.get(stmt.label.val, stmt.label.val) for stmt in program.stmts]
+            user_stmts = [
+                stmt for stmt, origin in zip(program.stmts, origins)
+                if origin not in stdlib_labels and not is_qualified(origin)
+            ]
+            write_coverage(interpreter, user_stmts, options.azor_file, options.coverage, options.coverage_format)
+
+
+def cached_main(interpreter: Interpreter, args, run_cache: RunCache, key: str, stdin):
+    """Runs main, keeping a copy of what it prints, and saves that and its exit code once it has succeeded."""
+    tee = Tee(sys.stdout)
+    saved_stdin = sys.stdin
+    if stdin is not None:
+        # stdin was read up front to compute the key, so the program reads that copy of it
+        sys.stdin = io.StringIO(stdin)
+    try:
+        with contextlib.redirect_stdout(tee):
+            exit_code = interpreter.main(args)
+    finally:
+        sys.stdin = saved_stdin
+
+    run_cache.put(key, exit_code, tee.getvalue())
+    return exit_code
+
+
+def write_stats(stats: Stats, filename):
+    if filename == "-":
+        stats.write(sys.stderr)
+    else:
+        with open(filename, "w") as f:
+            stats.write(f)
 
 
 if __name__ == "__main__":
@@ -11,19 +226,19 @@ if __name__ == "__main__":
         sys.exit(1)
 
     elif sys.argv[0].endswith("azor.py"):
-        _, azor_file, *args = sys.argv
+        options = parse_args(sys.argv[1:])
 
     else:
-        azor_file, *args = sys.argv
-
-    stdlib_stmts = Parser.parse_file("azor/stdlib.azor")
-    stmts = stdlib_stmts + Parser.parse_file(azor_file)
-
-    TypeChecker(stmts).check()
-
-    interpreter = Interpreter(stmts)
+        options = parse_args(sys.argv)
 
+    stats = Stats()
     try:
-        sys.exit(interpreter.main(args))
+        sys.exit(run(options, stats))
+    except AzorError as e:
+        print(e)
+        sys.exit(1)
     except KeyboardInterrupt:
         pass
+    finally:
+        if options.stats is not None:
+            write_stats(stats, options.stats)
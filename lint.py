@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+
+from src.tokens import AzorError
+from src.program import compile_file
+from src.modules import MODULE_SUFFIX, is_qualified
+from src.perflint import lint_program
+
+
+def parse_args(argv):
+    argparser = argparse.ArgumentParser(
+        prog="lint.py",
+        description="Report code which is accidentally quadratic, in Azor programs and the modules they import.")
+    argparser.add_argument("azor_files", nargs="+")
+    argparser.add_argument("--no-native", action="store_true",
+                           help="judge complexity as if run with azor.py --no-native")
+    return argparser.parse_args(argv)
+
+
+def source_file(program_file, label):
+    """The file the declaration with the given (unspecialized) label comes from."""
+    if is_qualified(label):
+        return os.path.join(os.path.dirname(program_file), label.split(".", 1)[0] + MODULE_SUFFIX)
+    return program_file
+
+
+def lint_file(filename, no_native=False):
+    """Findings in the program in filename and the modules it imports, as (file, finding) pairs."""
+    # every declaration is checked, not just those main reaches, since unused code is still worth linting
+    program = compile_file(filename, prune=False, cache_constants=False, cse=False)
+    return [(source_file(filename, finding.label), finding) for finding in lint_program(program, not no_native)]
+
+
+def main(options) -> int:
+    status = 0
+    reported = set()
+    for filename in options.azor_files:
+        try:
+            findings = lint_file(filename, options.no_native)
+        except AzorError as e:
+            print(f"{filename}:\n{e}", file=sys.stderr)
+            status = 1
+            continue
+
+        for path, finding in findings:
+            # modules imported by several of the files are only reported once
+            if (path, finding.key()) not in reported:
+                reported.add((path, finding.key()))
+                print(f"{path}:{finding.describe()}")
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args(sys.argv[1:])))
@@ -0,0 +1,212 @@
+import argparse
+import csv
+import io
+import math
+import sys
+import tracemalloc
+from contextlib import contextmanager
+
+from src.tokens import Tokenizer, source_lines
+from src.program import compile
+from src.stats import Stats
+from src.generate import ProgramGenerator
+
+# the generator parameters which can be varied, and the value each takes when it isn't the one being varied
+PARAMETERS = {
+    "declarations": 100,
+    "depth": 3,
+    "generic_ratio": 0.2,
+    "fan_out": 3,
+    "list_size": 100,
+}
+
+DEFAULT_SIZES = {
+    "declarations": [50, 100, 200, 400],
+    "depth": [3, 4, 5, 6],
+    "generic_ratio": [0.1, 0.2, 0.4, 0.8],
+    "fan_out": [1, 2, 4, 8],
+    "list_size": [100, 200, 400, 800],
+}
+
+PHASES = ["tokenize", "parse", "typecheck", "monomorphize", "cse", "analyze", "run"]
+
+# growth exponents above this fail the benchmark; anything quadratic is well above it
+DEFAULT_MAX_EXPONENT = 1.5
+
+# phases faster, or smaller, than these at the largest size are too noisy to fit
+MIN_FIT_SECONDS = 0.01
+MIN_FIT_BYTES = 64 * 1024
+
+
+class MemoryStats(Stats):
+    """Stats which also record the peak memory allocated during each phase, as traced by tracemalloc."""
+
+    def __init__(self):
+        super().__init__()
+        self.peaks = {}
+
+    @contextmanager
+    def phase(self, name):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peaks[name] = max(self.peaks.get(name, 0), peak - start)
+
+
+def measure(source: str, stats: Stats):
+    """Tokenizes, compiles and runs source, recording each phase in stats."""
+    with stats.phase("tokenize"):
+        Tokenizer(source_lines(io.StringIO(source))).tokenize()
+    program = compile(source, stats=stats, workers=1)
+    with stats.phase("run"):
+        program.run(stdout=io.StringIO())
+
+
+def benchmark(vary, sizes, seed=0, repeat=1):
+    """
+    Yields (value, input size, times, peaks) for each value of the varied parameter. Times are the fastest of
+    repeat runs. Memory is measured in a separate run, since tracing allocations slows everything down.
+
+    The input size is the number of tokens in the program, except when varying list_size, which changes how much
+    the program does rather than how big it is.
+    """
+    for value in sizes:
+        params = dict(PARAMETERS, **{vary: value})
+        source = ProgramGenerator(seed=seed, **params).generate()
+
+        times = {}
+        for _ in range(repeat):
+            stats = Stats()
+            measure(source, stats)
+            for phase in PHASES:
+                times[phase] = min(times.get(phase, math.inf), stats.timings.get(phase, 0))
+
+        stats = MemoryStats()
+        tracemalloc.start()
+        try:
+            measure(source, stats)
+        finally:
+            tracemalloc.stop()
+
+        size = value if vary == "list_size" else stats.counters["tokens"]
+        yield value, size, times, {phase: stats.peaks.get(phase, 0) for phase in PHASES}
+
+
+def growth_exponent(sizes, values):
+    """The slope of the least-squares line through log(value) against log(size), so n^k growth gives about k."""
+    points = [(math.log(s), math.log(v)) for s, v in zip(sizes, values) if s > 0 and v > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+
+
+def fit(sizes, values, minimum):
+    return growth_exponent(sizes, values) if values and max(values) >= minimum else None
+
+
+def format_exponent(k):
+    return "-" if k is None else f"{k:.2f}"
+
+
+def plot(rows, vary, filename):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    sizes = [row[1] for row in rows]
+    fig, (time_ax, memory_ax) = plt.subplots(1, 2, figsize=(12, 5))
+    for phase in PHASES:
+        time_ax.plot(sizes, [row[2][phase] for row in rows], marker="o", label=phase)
+        memory_ax.plot(sizes, [row[3][phase] / 2 ** 20 for row in rows], marker="o", label=phase)
+
+    xlabel = "list size" if vary == "list_size" else f"tokens (varying {vary})"
+    for ax, ylabel in [(time_ax, "seconds"), (memory_ax, "peak MiB")]:
+        ax.set_xscale("log")
+        ax.set_yscale("log")
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+    time_ax.legend()
+    fig.tight_layout()
+    fig.savefig(filename)
+
+
+def parse_args(argv):
+    argparser = argparse.ArgumentParser(
+        prog="scaling.py",
+        description="Time and measure the memory of each phase on generated programs of increasing size, and "
+                    "fit how each grows with the size.")
+    argparser.add_argument("--vary", choices=list(PARAMETERS), default="declarations",
+                           help="the generator parameter to increase")
+    argparser.add_argument("--sizes", type=float, nargs="+", default=None,
+                           help="values of the varied parameter (default depends on --vary)")
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--repeat", type=int, default=1,
+                           help="runs at each size, of which the fastest is kept")
+    argparser.add_argument("--max-exponent", type=float, default=DEFAULT_MAX_EXPONENT,
+                           help="exit with status 1 if any phase grows faster than size to this power")
+    argparser.add_argument("--csv", metavar="FILE", default=None,
+                           help="write the measurements to FILE as CSV")
+    argparser.add_argument("--plot", metavar="FILE", default=None,
+                           help="plot the measurements to FILE (requires matplotlib)")
+    options = argparser.parse_args(argv)
+
+    if options.sizes is None:
+        options.sizes = DEFAULT_SIZES[options.vary]
+    elif options.vary != "generic_ratio":
+        options.sizes = [int(s) for s in options.sizes]
+    if len(options.sizes) < 2:
+        argparser.error("at least two --sizes are needed to fit a growth exponent")
+
+    if options.plot is not None:
+        try:
+            import matplotlib
+        except ImportError:
+            argparser.error("--plot requires matplotlib")
+    return options
+
+
+def main(options) -> int:
+    rows = []
+    print(f"{options.vary:>13} {'size':>8} " + " ".join(f"{phase:>12}" for phase in PHASES))
+    for row in benchmark(options.vary, options.sizes, options.seed, options.repeat):
+        value, size, times, peaks = row
+        rows.append(row)
+        print(f"{value:>13} {size:>8} " + " ".join(f"{times[phase]:>11.4f}s" for phase in PHASES))
+        print(f"{'':>13} {'':>8} " + " ".join(f"{peaks[phase] / 2 ** 20:>9.2f}MiB" for phase in PHASES))
+
+    sizes = [row[1] for row in rows]
+    time_exponents = {phase: fit(sizes, [row[2][phase] for row in rows], MIN_FIT_SECONDS) for phase in PHASES}
+    memory_exponents = {phase: fit(sizes, [row[3][phase] for row in rows], MIN_FIT_BYTES) for phase in PHASES}
+    print(f"{'time exponent':>22} " + " ".join(f"{format_exponent(time_exponents[p]):>12}" for p in PHASES))
+    print(f"{'memory exponent':>22} " + " ".join(f"{format_exponent(memory_exponents[p]):>12}" for p in PHASES))
+
+    if options.csv is not None:
+        with open(options.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([options.vary, "size"] + [f"{p}_seconds" for p in PHASES] + [f"{p}_bytes" for p in PHASES])
+            for value, size, times, peaks in rows:
+                writer.writerow([value, size] + [times[p] for p in PHASES] + [peaks[p] for p in PHASES])
+
+    if options.plot is not None:
+        plot(rows, options.vary, options.plot)
+
+    superlinear = [
+        f"{phase} {kind} grows as size^{k:.2f}"
+        for kind, exponents in [("time", time_exponents), ("memory", memory_exponents)]
+        for phase, k in exponents.items() if k is not None and k > options.max_exponent
+    ]
+    for message in superlinear:
+        print(message, file=sys.stderr)
+    return 1 if superlinear else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args(sys.argv[1:])))
@@ -0,0 +1,203 @@
+import asyncio
+import inspect
+import sys
+import time
+from typing import List
+
+from .ast import Declaration, Expression
+from .tokens import Token
+from .evaluate import Interpreter, list_tail, HIGHER_ORDER_NATIVES
+from .governor import CLOCK_INTERVAL
+
+# how many evaluation steps run between chances for other tasks to run
+DEFAULT_YIELD_INTERVAL = 1000
+
+
+class AsyncInterpreter(Interpreter):
+    """
+    An interpreter for use inside an asyncio event loop. Evaluation hands control back to the loop every
+    yield_interval steps, and print and input use asyncio streams, so many programs can run concurrently on a
+    single thread.
+
+    reader and writer are an asyncio.StreamReader and StreamWriter. When they are not given, print writes to
+    sys.stdout and input reads from sys.stdin on the loop's default executor.
+    """
+
+    def __init__(self, stmts: List[Declaration], reader=None, writer=None, natives=None, arithmetic=None,
+                 limits=None, yield_interval=DEFAULT_YIELD_INTERVAL):
+        # native higher-order functions would call Azor functions, which are coroutines here, synchronously
+        natives = {k: v for k, v in (natives or {}).items() if k not in HIGHER_ORDER_NATIVES}
+        # lets are never unboxed and conses never looped here, so there is no need to look for them
+        super().__init__(stmts, natives, arithmetic, limits, unboxed_lets=set(), looped_conses=set())
+
+        self.reader = reader
+        self.writer = writer
+        self.symbol_table["print"] = self.print
+        self.symbol_table["input"] = self.input
+
+        self.yield_interval = yield_interval
+        self.next_yield = yield_interval
+
+    async def print(self, nums):
+        s = ''.join([chr(n) for n in nums])
+        if self.writer is None:
+            sys.stdout.write(s)
+        else:
+            self.writer.write(s.encode())
+            await self.writer.drain()
+
+    async def input(self):
+        if self.reader is None:
+            s = await asyncio.get_running_loop().run_in_executor(None, input)
+        else:
+            line = await self.reader.readline()
+            if not line:
+                raise EOFError
+            s = line.decode().rstrip("\n")
+        return [ord(c) for c in s]
+
+    async def main(self, args):
+        if self.limits.timeout is not None:
+            self.deadline = time.monotonic() + self.limits.timeout
+            self.next_check = min(self.max_steps + 1, self.steps + CLOCK_INTERVAL)
+
+        processed_args = [[ord(c) for c in arg] for arg in args]
+        return await (await self.evaluate_global("main"))(processed_args)
+
+    async def evaluate_global(self, name):
+        if name not in self.symbol_table:
+            stmt = self.stmts_by_label[name]
+
+            if stmt.typehint.argnames is None:
+                val = await self.evaluate_expression(stmt.rhs, {})
+
+            else:
+                async def val(*args):
+                    env = dict(zip(stmt.typehint.argnames, args))
+                    return await self.evaluate_expression(stmt.rhs, env)
+
+            self.symbol_table[name] = val
+
+        return self.symbol_table[name]
+
+    async def evaluate_expression(self, expr: Expression, env):
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self.check_budgets(expr.token)
+        if self.steps >= self.next_yield:
+            self.next_yield = self.steps + self.yield_interval
+            await asyncio.sleep(0)
+
+        try:
+            return await self.evaluate_expression_unsafe(expr, env)
+        except RecursionError:
+            expr.token.raise_error("Maximum recursion depth exceeded evaluating this expression")
+
+    async def evaluate_expression_unsafe(self, expr: Expression, env):
+        if expr.expr_type == Expression.SIMPLE:
+            return await self.evaluate_simple(expr.token, env)
+
+        elif expr.expr_type == Expression.TUPLE:
+            return tuple([await self.evaluate_expression(e, env) for e in expr.elements])
+
+        elif expr.expr_type == Expression.LIST:
+            self.allocate(len(expr.elements), expr.token)
+            return [await self.evaluate_expression(e, env) for e in expr.elements]
+
+        elif expr.expr_type == Expression.IF:
+            return await self.evaluate_if(expr, env)
+
+        elif expr.expr_type == Expression.BINOP:
+            left = await self.evaluate_expression(expr.left, env)
+            right = await self.evaluate_expression(expr.right, env)
+            try:
+                return self.binops[expr.token.val](left, right)
+            except ArithmeticError as e:
+                expr.token.raise_error(str(e))
+
+        elif expr.expr_type == Expression.CONS:
+            lst = [
+                await self.evaluate_expression(expr.left, env),
+                *await self.evaluate_expression(expr.right, env),
+            ]
+            self.allocate(len(lst), expr.token)
+            return lst
+
+        elif expr.expr_type == Expression.LET:
+            return await self.evaluate_let(expr, env)
+
+        elif expr.expr_type == Expression.CALL:
+            callee = await self.evaluate_expression(expr.left, env)
+
+            args = [await self.evaluate_expression(arg, env) for arg in expr.args.elements]
+
+            self.depth += 1
+            try:
+                if self.depth > self.peak_depth:
+                    if self.depth > self.max_depth:
+                        raise self.depth_exceeded(expr.token)
+                    self.peak_depth = self.depth
+                result = callee(*args)
+                if inspect.isawaitable(result):
+                    result = await result
+                return result
+            except EOFError:
+                expr.token.raise_error("Reached the end of the input")
+            finally:
+                self.depth -= 1
+
+        elif expr.expr_type == Expression.GENERIC:
+            return await self.evaluate_expression(expr.left, env)
+
+        elif expr.expr_type == Expression.PREFIX:
+            if expr.token.ttype == '!':
+                return not await self.evaluate_expression(expr.right, env)
+            elif expr.token.s == '-':
+                value = await self.evaluate_expression(expr.right, env)
+                try:
+                    return self.negate(value)
+                except ArithmeticError as e:
+                    expr.token.raise_error(str(e))
+            else:
+                raise ValueError
+
+        else:
+            raise ValueError(f"Cannot evaluate expression of type {expr.expr_type}")
+
+    async def evaluate_simple(self, token: Token, env):
+        if token.ttype == "LABEL" and token.val not in env:
+            return await self.evaluate_global(token.val)
+        return super().evaluate_simple(token, env)
+
+    async def evaluate_if(self, expr, env):
+        if expr.condition.expr_type == Expression.ARROW:
+            head, tail, lst_expr = expr.condition.left.left, expr.condition.left.right, expr.condition.right
+            lst = await self.evaluate_expression(lst_expr, env)
+            if len(lst) > 0:
+                subenv = {**env, head.token.val: lst[0], tail.token.val: list_tail(lst)}
+                return await self.evaluate_expression(expr.left, subenv)
+            else:
+                return await self.evaluate_expression(expr.right, env)
+
+        else:
+            if await self.evaluate_expression(expr.condition, env):
+                return await self.evaluate_expression(expr.left, env)
+            else:
+                return await self.evaluate_expression(expr.right, env)
+
+    async def evaluate_let(self, expr, env):
+        dest, source = expr.left.left, expr.left.right
+
+        if dest.expr_type == Expression.SIMPLE:
+            subenv = {**env, dest.token.val: await self.evaluate_expression(source, env)}
+
+        elif dest.expr_type == Expression.TUPLE:
+            subenv = {**env}
+            t = await self.evaluate_expression(source, env)
+            for label_expr, val in zip(dest.elements, t):
+                subenv[label_expr.token.val] = val
+
+        else:
+            raise ValueError
+
+        return await self.evaluate_expression(expr.right, subenv)
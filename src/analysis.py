@@ -0,0 +1,304 @@
+import math
+from typing import Dict, Iterator, List, Set
+from .ast import Expression, Declaration
+
+# Builtins that observably interact with the outside world. Any expression that can reach one of
+# these is impure and must be evaluated exactly once, in program order.
+IMPURE_BUILTINS = {"print", "input", "rand"}
+
+# how many times a declaration on a cycle of calls is estimated to be evaluated for each call of it
+RECURSION_ESTIMATE = 100
+
+
+def children(expr: Expression) -> Iterator[Expression]:
+    if expr.expr_type == Expression.SIMPLE:
+        return
+    elif expr.expr_type in (Expression.LIST, Expression.TUPLE):
+        yield from expr.elements
+    elif expr.expr_type == Expression.CALL:
+        yield expr.left
+        yield from expr.args.elements
+    elif expr.expr_type == Expression.IF:
+        yield expr.condition
+        yield expr.left
+        yield expr.right
+    elif expr.expr_type in (Expression.LET, Expression.CONS, Expression.BINOP, Expression.ARROW):
+        yield expr.left
+        yield expr.right
+    elif expr.expr_type == Expression.PREFIX:
+        yield expr.right
+    elif expr.expr_type == Expression.GENERIC:
+        yield expr.left
+    else:
+        raise ValueError(f"Unknown expression type: {expr.expr_type}")
+
+
+def walk(expr: Expression) -> Iterator[Expression]:
+    """Yields expr and all of its subexpressions in preorder."""
+    stack = [expr]
+    while stack:
+        e = stack.pop()
+        yield e
+        stack.extend(reversed(list(children(e))))
+
+
+def callee_name(expr: Expression, global_names: Set[str]):
+    """The name of the global a CALL invokes, or None if the callee is only known at runtime."""
+    callee = expr.left
+    while callee.expr_type == Expression.GENERIC:
+        callee = callee.left
+    if callee.expr_type == Expression.SIMPLE and callee.token.val in global_names:
+        return callee.token.val
+    return None
+
+
+def global_references(expr: Expression, global_names: Set[str]) -> Set[str]:
+    # Azor forbids local names from shadowing globals, so any label matching a global name is a
+    # reference to that global.
+    return {
+        e.token.val for e in walk(expr)
+        if e.expr_type == Expression.SIMPLE and e.token.ttype == "LABEL" and e.token.val in global_names
+    }
+
+
+def has_unknown_call(expr: Expression, global_names: Set[str]) -> bool:
+    return any(
+        e.expr_type == Expression.CALL and callee_name(e, global_names) is None
+        for e in walk(expr)
+    )
+
+
+def tail_positions(expr: Expression) -> Iterator[Expression]:
+    """The subexpressions of expr whose value may become the value of expr itself."""
+    if expr.expr_type == Expression.IF:
+        yield from tail_positions(expr.left)
+        yield from tail_positions(expr.right)
+    elif expr.expr_type == Expression.LET:
+        yield from tail_positions(expr.right)
+    else:
+        yield expr
+
+
+def unboxable_lets(stmts: List[Declaration]) -> Set[int]:
+    """
+    The ids of let expressions which unpack the result of calling a function that builds a tuple in
+    tail position. Such tuples never escape, so their elements can be bound straight into the let's
+    environment without the tuple being built.
+    """
+    functions = {stmt.label.val: stmt for stmt in stmts if stmt.typehint.argnames is not None}
+    returns_tuple = {
+        label for label, stmt in functions.items()
+        if any(e.expr_type == Expression.TUPLE for e in tail_positions(stmt.rhs))
+    }
+
+    function_names = set(functions)
+    out = set()
+    for stmt in stmts:
+        for e in walk(stmt.rhs):
+            if e.expr_type != Expression.LET or e.left.left.expr_type != Expression.TUPLE:
+                continue
+            source = e.left.right
+            if source.expr_type == Expression.CALL and callee_name(source, function_names) in returns_tuple:
+                out.add(id(e))
+
+    return out
+
+
+def loopable_conses(stmts: List[Declaration]) -> Set[int]:
+    """
+    The ids of ~ expressions whose tail may be built by a call or another ~. These are evaluated by a loop which
+    appends every head to one result list, rather than by recursion which copies the tail at every level.
+
+    Tail calls a declaration containing such a ~ makes to itself are included too, so that a function which skips
+    some elements, like filter, enters the loop at the first one it skips as well as at the first one it keeps.
+    """
+    out = set()
+    for stmt in stmts:
+        conses = {
+            id(e) for e in walk(stmt.rhs)
+            if e.expr_type == Expression.CONS and any(
+                t.expr_type in (Expression.CALL, Expression.CONS) for t in tail_positions(e.right))
+        }
+        if conses:
+            out |= conses
+            label = stmt.label.val
+            out |= {
+                id(t) for t in tail_positions(stmt.rhs)
+                if t.expr_type == Expression.CALL and callee_name(t, {label}) == label
+            }
+    return out
+
+
+def bound_labels(expr: Expression) -> Set[str]:
+    """Local names bound by let and if unpacking anywhere within expr."""
+    bound = set()
+    for e in walk(expr):
+        if e.expr_type == Expression.LET:
+            dest = e.left.left
+            bound |= {d.token.val for d in (dest.elements if dest.expr_type == Expression.TUPLE else [dest])}
+        elif e.expr_type == Expression.IF and e.condition.expr_type == Expression.ARROW:
+            bound |= {e.condition.left.left.token.val, e.condition.left.right.token.val}
+    return bound
+
+
+def free_locals(expr: Expression, global_names: Set[str]) -> Set[str]:
+    """Local names which expr reads from its enclosing environment."""
+    labels = {
+        e.token.val for e in walk(expr)
+        if e.expr_type == Expression.SIMPLE and e.token.ttype == "LABEL"
+    }
+    return labels - global_names - bound_labels(expr)
+
+
+def reachable(references: Dict[str, Set[str]], roots) -> Set[str]:
+    """roots, along with everything they can reach through references."""
+    seen = set()
+    stack = list(roots)
+    while stack:
+        label = stack.pop()
+        if label in seen:
+            continue
+        seen.add(label)
+        stack.extend(references.get(label, ()))
+    return seen
+
+
+class ProgramAnalysis:
+    def __init__(self, stmts: List[Declaration]):
+        self.stmts_by_label: Dict[str, Declaration] = {stmt.label.val: stmt for stmt in stmts}
+        self.global_names: Set[str] = set(self.stmts_by_label) | IMPURE_BUILTINS
+
+        self.references: Dict[str, Set[str]] = {
+            label: global_references(stmt.rhs, self.global_names)
+            for label, stmt in self.stmts_by_label.items()
+        }
+
+        # effectful declarations can reach a side-effecting builtin by name; impure ones additionally
+        # include any declaration which can reach a call of a function-valued local, which could be
+        # anything at all
+        self.effectful = self._referrer_closure(IMPURE_BUILTINS)
+        self.impure = self._referrer_closure(self.effectful | {
+            label for label, stmt in self.stmts_by_label.items()
+            if has_unknown_call(stmt.rhs, self.global_names)
+        })
+        self.cyclic: Set[str] = set()
+        self.recursive = self._find_recursive()
+        self._costs: Dict[str, float] = {}
+
+    def _referrer_closure(self, seed: Set[str]) -> Set[str]:
+        """seed, along with every declaration which can reach something in seed."""
+        referrers: Dict[str, Set[str]] = {}
+        for label, refs in self.references.items():
+            for ref in refs:
+                referrers.setdefault(ref, set()).add(label)
+
+        closure = set(seed)
+        stack = list(seed)
+        while stack:
+            for label in referrers.get(stack.pop(), ()):
+                if label not in closure:
+                    closure.add(label)
+                    stack.append(label)
+
+        return closure
+
+    def reachable(self, roots) -> Set[str]:
+        return reachable(self.references, roots)
+
+    def _find_recursive(self) -> Set[str]:
+        """
+        Declarations which can reach a cycle in the reference graph, and so have unbounded cost. Those on a cycle
+        are added to cyclic as well.
+        """
+        recursive = set()
+        # components come out of Tarjan's algorithm in reverse topological order, so every
+        # component's successors have already been classified by the time it is reached
+        for component in strongly_connected_components(self.references):
+            label = component[0]
+            refs = set().union(*(self.references[c] for c in component))
+            if len(component) > 1 or label in refs:
+                self.cyclic.update(component)
+            if label in self.cyclic or refs & recursive:
+                recursive.update(component)
+        return recursive
+
+    def is_pure(self, expr: Expression) -> bool:
+        return not (
+            global_references(expr, self.global_names) & self.impure
+            or has_unknown_call(expr, self.global_names)
+        )
+
+    def declaration_cost(self, label: str) -> float:
+        """
+        A static estimate of the number of nodes a call of label evaluates. A declaration on a cycle is assumed
+        to be evaluated RECURSION_ESTIMATE times per call, so that a small recursive function is cheap enough for
+        a threshold on cost to exclude.
+        """
+        if label not in self.stmts_by_label:
+            return 1
+        if label not in self._costs:
+            if label in self.cyclic:
+                # what calls back into label cost while its own cost is being found
+                self._costs[label] = RECURSION_ESTIMATE
+                self._costs[label] = self.cost(self.stmts_by_label[label].rhs) * RECURSION_ESTIMATE
+            else:
+                self._costs[label] = self.cost(self.stmts_by_label[label].rhs)
+        return self._costs[label]
+
+    def cost(self, expr: Expression) -> float:
+        """A static estimate of the number of nodes evaluated by expr."""
+        total = 0
+        for e in walk(expr):
+            total += 1
+            if e.expr_type == Expression.CALL:
+                name = callee_name(e, self.global_names)
+                total += math.inf if name is None else self.declaration_cost(name)
+        return total
+
+
+def strongly_connected_components(graph: Dict[str, Set[str]]) -> List[List[str]]:
+    """Tarjan's algorithm, iteratively so that deep call chains don't hit the recursion limit."""
+    index: Dict[str, int] = {}
+    lowlink: Dict[str, int] = {}
+    stack: List[str] = []
+    on_stack: Set[str] = set()
+    components = []
+
+    for root in graph:
+        if root in index:
+            continue
+
+        work = [(root, iter(graph[root]))]
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+
+        while work:
+            node, edges = work[-1]
+            for succ in edges:
+                if succ not in graph:
+                    continue
+                if succ not in index:
+                    index[succ] = lowlink[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(graph[succ])))
+                    break
+                elif succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    return components
@@ -0,0 +1,103 @@
+import operator
+
+BIGINT = "bigint"
+WRAP64 = "wrap64"
+CHECKED64 = "checked64"
+MODES = [BIGINT, WRAP64, CHECKED64]
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+INT64_MODULUS = 2 ** 64
+
+# Comparisons and logic can't overflow, so they are shared by every mode. Azor booleans are always Python
+# bools, for which the bitwise operators agree with the logical ones.
+NON_ARITH_BINOPS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+
+    '&': operator.and_,
+    '|': operator.or_,
+    '^': operator.xor,
+    '!^': operator.is_,
+}
+
+
+def wrap64(n):
+    return ((n - INT64_MIN) % INT64_MODULUS) + INT64_MIN
+
+
+def check64(n):
+    if n < INT64_MIN or n > INT64_MAX:
+        raise OverflowError("Integer overflow: result does not fit in 64 bits")
+    return n
+
+
+def check_pow_size(a, b, max_bits):
+    # |a| < 2 ** bit_length, so a ** b has at most bit_length * b bits
+    if b > 0 and abs(a) > 1 and abs(a).bit_length() * b > max_bits:
+        raise OverflowError(f"Result of ** could be larger than {max_bits} bits")
+
+
+class Arithmetic:
+    """
+    The integer semantics of a run. In the default bigint mode, integers are unbounded, as in Python. The 64-bit
+    modes either wrap around like a machine integer would, or raise an error on overflow. max_pow_bits bounds the
+    size of the result of **, which is checked before anything is computed; wrapping ** never builds a big result.
+    """
+
+    def __init__(self, mode=BIGINT, max_pow_bits=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown arithmetic mode: {mode}")
+        self.mode = mode
+        self.max_pow_bits = max_pow_bits
+
+        if mode == BIGINT:
+            arith = {
+                '+': operator.add,
+                '-': operator.sub,
+                '*': operator.mul,
+                '/': operator.floordiv,
+                '%': operator.mod,
+                '**': self.bounded_pow if max_pow_bits is not None else operator.pow,
+            }
+            self.negate = operator.neg
+
+        else:
+            fix = wrap64 if mode == WRAP64 else check64
+            arith = {
+                '+': lambda a, b: fix(a + b),
+                '-': lambda a, b: fix(a - b),
+                '*': lambda a, b: fix(a * b),
+                '/': lambda a, b: fix(a // b),
+                '%': operator.mod,
+                '**': self.wrapped_pow if mode == WRAP64 else self.checked_pow,
+            }
+            self.negate = lambda a: fix(-a)
+
+        self.binops = {**arith, **NON_ARITH_BINOPS}
+
+    def __reduce__(self):
+        return Arithmetic, (self.mode, self.max_pow_bits)
+
+    def bounded_pow(self, a, b):
+        check_pow_size(a, b, self.max_pow_bits)
+        return a ** b
+
+    def wrapped_pow(self, a, b):
+        # modular exponentiation never builds the full result
+        if b < 0:
+            return wrap64(a ** b)
+        return wrap64(pow(a, b, INT64_MODULUS))
+
+    def checked_pow(self, a, b):
+        if self.max_pow_bits is not None:
+            check_pow_size(a, b, self.max_pow_bits)
+        # |a| >= 2 ** (bit_length - 1), so this overflows for certain, and is refused before it is computed. Results
+        # which might fit are computed and checked exactly.
+        if b > 0 and abs(a) > 1 and (abs(a).bit_length() - 1) * b >= 64:
+            raise OverflowError("Integer overflow: result does not fit in 64 bits")
+        return check64(a ** b)
@@ -0,0 +1,49 @@
+import hashlib
+from typing import Dict, List
+
+from .ast import Declaration
+from .analysis import ProgramAnalysis
+from .modules import cache_path, read_pickle, write_pickle
+
+# bump when the cached format, or the hashing of declarations, changes
+CONSTANTS_VERSION = 2
+
+
+def declaration_hash(stmt: Declaration) -> str:
+    return hashlib.sha256(str(stmt).encode()).hexdigest()
+
+
+def closure_hashes(stmts: List[Declaration], labels) -> Dict[str, str]:
+    """
+    For each of labels, a hash of the declarations it can reach, itself included. A constant's value depends on
+    nothing else, so it can be reused in any program where its closure hash is the same.
+    """
+    analysis = ProgramAnalysis(stmts)
+    hashes = {label: declaration_hash(stmt) for label, stmt in analysis.stmts_by_label.items()}
+    return {
+        label: hashlib.sha256("\n".join(sorted(
+            hashes[dep] for dep in analysis.reachable({label}) if dep in hashes
+        )).encode()).hexdigest()
+        for label in labels
+    }
+
+
+class ConstantCache:
+    """
+    The values of a program's pure constants, saved between runs in the cache directory next to its source. Values
+    are keyed by the arithmetic settings they were computed with and the closure hash of their declaration, so
+    editing a constant, or anything it uses, makes its saved value a miss rather than a wrong answer.
+    """
+
+    def __init__(self, path: str):
+        self.filename = cache_path(path, ".constants.pickle")
+
+    def read(self) -> Dict[tuple, object]:
+        saved = read_pickle(self.filename)
+        if not isinstance(saved, tuple) or len(saved) != 2 or saved[0] != CONSTANTS_VERSION:
+            return {}
+        return saved[1]
+
+    def write(self, values: Dict[tuple, object]):
+        """Replaces the cached values, if the directory is writable."""
+        write_pickle(self.filename, (CONSTANTS_VERSION, values))
@@ -0,0 +1,81 @@
+from collections import defaultdict
+from typing import Dict, List
+
+from .ast import Declaration, Expression
+from .analysis import walk
+from .evaluate import Interpreter
+
+LISTING = "listing"
+LCOV = "lcov"
+FORMATS = [LISTING, LCOV]
+
+
+class CoverageInterpreter(Interpreter):
+    """An interpreter which counts how many times each expression node is evaluated."""
+
+    def __init__(self, stmts: List[Declaration], natives=None, arithmetic=None, limits=None, unboxed_lets=None):
+        super().__init__(stmts, natives, arithmetic, limits, unboxed_lets=unboxed_lets)
+        self.counts = defaultdict(int)
+
+    def evaluate_expression(self, expr: Expression, env):
+        self.counts[id(expr)] += 1
+        return super().evaluate_expression(expr, env)
+
+    def visit(self, expr: Expression):
+        self.counts[id(expr)] += 1
+
+    def enter(self, expr: Expression):
+        # the loops call declared functions without evaluating their names
+        callee = expr.left
+        while callee.expr_type == Expression.GENERIC:
+            self.counts[id(callee)] += 1
+            callee = callee.left
+        self.counts[id(callee)] += 1
+
+
+class Coverage:
+    """
+    The counts from a CoverageInterpreter, for the declarations of one source file. A line's hits are the most
+    times any node starting on it was evaluated, which is how many times the line ran; its evaluations are the
+    total over all of its nodes, which is how much work was done there.
+    """
+
+    def __init__(self, interpreter: CoverageInterpreter, stmts: List[Declaration]):
+        self.hits: Dict[int, int] = {}
+        self.evaluations: Dict[int, int] = defaultdict(int)
+        for e in (e for stmt in stmts for e in walk(stmt.rhs)):
+            count = interpreter.counts.get(id(e), 0)
+            line = e.token.line_no + 1
+            self.hits[line] = max(self.hits.get(line, 0), count)
+            self.evaluations[line] += count
+
+    def write_listing(self, source_lines: List[str], file):
+        file.write(f"{'hits':>10} {'evals':>10}\n")
+        for i, text in enumerate(source_lines):
+            line = i + 1
+            if line not in self.hits:
+                prefix = f"{'-':>10} {'':>10}"
+            elif self.hits[line] == 0:
+                prefix = f"{'#####':>10} {'':>10}"
+            else:
+                prefix = f"{self.hits[line]:>10} {self.evaluations[line]:>10}"
+            file.write(f"{prefix} {i + 1:>5}: {text}\n")
+
+    def write_lcov(self, filename, file):
+        file.write(f"SF:{filename}\n")
+        for line in sorted(self.hits):
+            file.write(f"DA:{line},{self.hits[line]}\n")
+        file.write(f"LH:{sum(1 for count in self.hits.values() if count > 0)}\n")
+        file.write(f"LF:{len(self.hits)}\n")
+        file.write("end_of_record\n")
+
+
+def write_coverage(interpreter: CoverageInterpreter, stmts: List[Declaration], source_filename, output_filename,
+                   output_format=LISTING):
+    coverage = Coverage(interpreter, stmts)
+    with open(output_filename, "w") as f:
+        if output_format == LCOV:
+            coverage.write_lcov(source_filename, f)
+        else:
+            with open(source_filename, "r") as fh:
+                coverage.write_listing(fh.read().replace('\t', '    ').split("\n"), f)
@@ -0,0 +1,259 @@
+import copy
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from typing import Dict, List, Set
+
+from .ast import Declaration, Expression
+from .analysis import ProgramAnalysis, children, free_locals, tail_positions
+
+# prefix of the locals bound to hoisted subexpressions, which can't clash with a name in the source since it
+# isn't a valid label
+CSE_PREFIX = "$cse"
+
+
+def map_children(expr: Expression, fn):
+    """Replaces each child of expr with fn(child), in place."""
+    if expr.expr_type in (Expression.LIST, Expression.TUPLE):
+        expr.elements = [fn(e) for e in expr.elements]
+    elif expr.expr_type == Expression.CALL:
+        expr.left = fn(expr.left)
+        expr.args.elements = [fn(e) for e in expr.args.elements]
+    elif expr.expr_type == Expression.IF:
+        expr.condition = fn(expr.condition)
+        expr.left = fn(expr.left)
+        expr.right = fn(expr.right)
+    elif expr.expr_type in (Expression.LET, Expression.CONS, Expression.BINOP, Expression.ARROW):
+        expr.left = fn(expr.left)
+        expr.right = fn(expr.right)
+    elif expr.expr_type == Expression.PREFIX:
+        expr.right = fn(expr.right)
+    elif expr.expr_type == Expression.GENERIC:
+        expr.left = fn(expr.left)
+
+
+class DeclarationIndex:
+    """
+    Everything CommonSubexpressions needs to know about a declaration's body, computed in one pass over it: each
+    node's position in preorder and the extent of its subtree, its parent, whether it is pure, a key which is
+    equal for nodes with the same structure and tokens, and the positions of the nodes binding each local name.
+    """
+
+    def __init__(self, expr: Expression, analysis: ProgramAnalysis, key_ids: Dict[tuple, int]):
+        self.nodes: List[Expression] = []
+        self.pre: Dict[int, int] = {}
+        self.parent: Dict[int, Expression] = {}
+        # a name can be bound again in another branch, so every binder is kept, in preorder
+        self.binders: Dict[str, List[int]] = defaultdict(list)
+        node_children: List[List[Expression]] = []
+
+        stack = [(expr, None)]
+        while stack:
+            e, parent = stack.pop()
+            self.pre[id(e)] = len(self.nodes)
+            self.nodes.append(e)
+            self.parent[id(e)] = parent
+            for name in bound_here(e):
+                self.binders[name].append(self.pre[id(e)])
+            kids = list(children(e))
+            node_children.append(kids)
+            stack.extend((child, e) for child in reversed(kids))
+
+        # children come after their parents in preorder, so going backwards sees every child first
+        self.end: Dict[int, int] = {}
+        self.key: Dict[int, int] = {}
+        self.pure: Dict[int, bool] = {}
+        for i in range(len(self.nodes) - 1, -1, -1):
+            e = self.nodes[i]
+            kids = node_children[i]
+            self.end[id(e)] = self.end[id(kids[-1])] if kids else i
+
+            token = e.token
+            if e.expr_type == Expression.SIMPLE:
+                own = (token.ttype, tuple(token.val) if token.ttype == "STRING" else token.val)
+            elif e.expr_type == Expression.LIST:
+                own = str(e.typehint)
+            elif e.expr_type in (Expression.BINOP, Expression.PREFIX):
+                own = token.s
+            elif e.expr_type == Expression.GENERIC:
+                own = tuple(map(str, e.elements))
+            else:
+                own = None
+            key = (e.expr_type, own, *(self.key[id(k)] for k in kids))
+            self.key[id(e)] = key_ids.setdefault(key, len(key_ids))
+
+            if e.expr_type == Expression.SIMPLE:
+                self.pure[id(e)] = not (token.ttype == "LABEL" and token.val in analysis.impure)
+            elif e.expr_type == Expression.CALL and not is_known_call(e, analysis.global_names):
+                self.pure[id(e)] = False
+            else:
+                self.pure[id(e)] = all(self.pure[id(k)] for k in kids)
+
+    def contains(self, outer: Expression, inner_pre: int) -> bool:
+        return self.pre[id(outer)] <= inner_pre <= self.end[id(outer)]
+
+    def binds_inside(self, outer: Expression, name: str) -> bool:
+        """Whether name is bound anywhere within outer."""
+        positions = self.binders.get(name, [])
+        i = bisect_left(positions, self.pre[id(outer)])
+        return i < len(positions) and positions[i] <= self.end[id(outer)]
+
+    def lca(self, nodes: List[Expression]) -> Expression:
+        """The smallest expression containing every one of nodes, which are in preorder."""
+        last = self.pre[id(nodes[-1])]
+        e = nodes[0]
+        while not self.contains(e, last):
+            e = self.parent[id(e)]
+        return e
+
+
+def bound_here(e: Expression) -> List[str]:
+    """The local names e itself binds."""
+    if e.expr_type == Expression.LET:
+        dest = e.left.left
+        return [d.token.val for d in (dest.elements if dest.expr_type == Expression.TUPLE else [dest])]
+    elif e.expr_type == Expression.IF and e.condition.expr_type == Expression.ARROW:
+        return [e.condition.left.left.token.val, e.condition.left.right.token.val]
+    return []
+
+
+def is_known_call(e: Expression, global_names: Set[str]) -> bool:
+    callee = e.left
+    while callee.expr_type == Expression.GENERIC:
+        callee = callee.left
+    return callee.expr_type == Expression.SIMPLE and callee.token.val in global_names
+
+
+class CommonSubexpressions:
+    """
+    Hoists calls which appear more than once in a declaration's body into a let, so they are evaluated once.
+
+    Only pure calls are hoisted, to the smallest pure expression containing every occurrence, and only if that
+    expression evaluates the call on every path through it. So a hoisted call never runs when it wouldn't have
+    before, and nothing with a side effect can be reordered around it. Calls in tail position, either of the body
+    or of a ~, are left where they are, since the interpreter runs those as loops rather than recursion.
+
+    Each declaration is rewritten in rounds. A round indexes the body once, then hoists every repeated call which
+    doesn't overlap one hoisted before it, outermost first. Hoisting a call also shares the calls inside it, and
+    any of those still repeated are hoisted by the next round, which is only needed if some were.
+    """
+
+    def __init__(self, stmts: List[Declaration]):
+        self.stmts = stmts
+        self.analysis = ProgramAnalysis(stmts)
+        self.hoisted = 0
+        self.key_ids: Dict[tuple, int] = {}
+
+    def run(self) -> int:
+        """Rewrites every declaration in place, returning the number of subexpressions hoisted."""
+        for stmt in self.stmts:
+            while self.eliminate(stmt):
+                pass
+        return self.hoisted
+
+    def eliminate(self, stmt: Declaration) -> bool:
+        """One round of hoisting in stmt, returning whether another round could hoist more."""
+        index = DeclarationIndex(stmt.rhs, self.analysis, self.key_ids)
+
+        occurrences = defaultdict(list)
+        for e in index.nodes:
+            if e.expr_type == Expression.CALL and index.pure[id(e)]:
+                occurrences[index.key[id(e)]].append(e)
+        repeated = [nodes for nodes in occurrences.values() if len(nodes) > 1]
+        if not repeated:
+            return False
+
+        tail_calls = {id(e) for e in tail_positions(stmt.rhs)}
+        for e in index.nodes:
+            if e.expr_type == Expression.CONS:
+                tail_calls |= {id(t) for t in tail_positions(e.right)}
+
+        # the preorder positions of occurrences of calls hoisted this round, which later ones mustn't overlap
+        claimed: List[int] = []
+        hoists = defaultdict(list)
+        references: Dict[int, str] = {}
+        deferred = False
+
+        # first occurrences in preorder, so outer calls come before the calls inside them
+        for nodes in sorted(repeated, key=lambda nodes: index.pre[id(nodes[0])]):
+            if any(id(e) in tail_calls for e in nodes):
+                continue
+            if any(self.overlaps(index, e, claimed) for e in nodes):
+                # hoisting the call it overlaps removes some occurrences and moves one, so try again next round
+                deferred = True
+                continue
+            target = index.lca(nodes)
+            if not index.pure[id(target)] or not self.always_evaluated(index, target, nodes):
+                continue
+            free = free_locals(nodes[0], self.analysis.global_names)
+            if any(index.binds_inside(target, name) for name in free):
+                continue
+
+            name = f"{CSE_PREFIX}{self.hoisted}"
+            self.hoisted += 1
+            hoists[id(target)].append((name, nodes[0]))
+            for e in nodes:
+                references[id(e)] = name
+                insort(claimed, index.pre[id(e)])
+
+        if not hoists:
+            return False
+        stmt.rhs = self.rewrite(stmt.rhs, hoists, references)
+        return deferred
+
+    @staticmethod
+    def overlaps(index: DeclarationIndex, e: Expression, claimed: List[int]) -> bool:
+        """
+        Whether e is inside, or contains, a claimed occurrence. Claimed occurrences never overlap each other, so
+        the one starting last before the end of e is the only one which can.
+        """
+        i = bisect_right(claimed, index.end[id(e)])
+        if i == 0:
+            return False
+        start = claimed[i - 1]
+        return start >= index.pre[id(e)] or index.end[id(index.nodes[start])] >= index.pre[id(e)]
+
+    def always_evaluated(self, index: DeclarationIndex, target: Expression, nodes: List[Expression]) -> bool:
+        """Whether evaluating target always evaluates one of nodes."""
+        found = {id(e) for e in nodes}
+        # only the paths from target down to the occurrences need looking at
+        on_path = set()
+        for e in nodes:
+            while e is not target and id(e) not in on_path:
+                on_path.add(id(e))
+                e = index.parent[id(e)]
+
+        def evaluated(e: Expression) -> bool:
+            if id(e) in found:
+                return True
+            if e is not target and id(e) not in on_path:
+                return False
+            if e.expr_type == Expression.IF:
+                return evaluated(e.condition) or (evaluated(e.left) and evaluated(e.right))
+            return any(evaluated(child) for child in children(e))
+
+        return evaluated(target)
+
+    def rewrite(self, expr: Expression, hoists, references) -> Expression:
+        """expr with each hoisted occurrence replaced by its local, and each hoist's let wrapped around its target."""
+        if id(expr) in references:
+            return self.reference(expr, references[id(expr)])
+
+        map_children(expr, lambda child: self.rewrite(child, hoists, references))
+        for name, first in hoists.get(id(expr), ()):
+            token = copy.copy(expr.token)
+            token.s = "let"
+            token.ttype = "LET"
+            out = Expression(token, Expression.LET)
+            out.left = Expression(first.token, Expression.ARROW)
+            out.left.left = self.reference(first, name)
+            out.left.right = first
+            out.right = expr
+            expr = out
+        return expr
+
+    @staticmethod
+    def reference(first: Expression, name: str) -> Expression:
+        token = copy.copy(first.token)
+        token.s = token.val = name
+        token.ttype = "LABEL"
+        return Expression(token, Expression.SIMPLE)
@@ -1,38 +1,102 @@
-from typing import List
+import math
+import time
+from collections.abc import Sequence
+from itertools import islice
+from typing import Dict, List
 from random import randrange
 from src.tokens import Token
 from src.ast import Declaration, Expression
 from src.typecheck import BINOP_TYPES
-
-
-BINOPS = {
-    '+': lambda a, b: a + b,
-    '-': lambda a, b: a - b,
-    '*': lambda a, b: a * b,
-    '/': lambda a, b: a // b,
-    '%': lambda a, b: a % b,
-    '**': lambda a, b: a ** b,
-
-    '==': lambda a, b: a == b,
-    '!=': lambda a, b: a != b,
-    '<': lambda a, b: a < b,
-    '>': lambda a, b: a > b,
-    '<=': lambda a, b: a <= b,
-    '>=': lambda a, b: a >= b,
-
-    '&': lambda a, b: a and b,
-    '|': lambda a, b: a or b,
-    '^': lambda a, b: a is not b,
-    '!^': lambda a, b: a is b,
-}
-
-
-def AzorPrint(nums):
-    print(''.join([chr(n) for n in nums]), end='')
-
-
-def AzorInput():
-    s = input()
+from src.analysis import unboxable_lets, loopable_conses
+from src.fusion import FusedCall, MAP, FILTER, FOLDL
+from src.arith import Arithmetic, BIGINT
+from src.governor import Limits, ResourceLimitExceeded, CLOCK_INTERVAL
+from src.types import (
+    AzorType,
+    same_type,
+    LEN_TYPE,
+    CONCAT_TYPE,
+    REVERSE_TYPE,
+    MAP_TYPE,
+    FILTER_TYPE,
+    FOLDL_TYPE,
+    FOLDR_TYPE,
+    SUM_TYPE,
+    NTH_TYPE,
+)
+
+
+BINOPS = Arithmetic().binops
+
+
+class ListView(Sequence):
+    """
+    An immutable view of lst[start:]. Unpacking h ~ t <- lst binds t to one of these, so walking down a list
+    never copies it.
+    """
+    __slots__ = ("lst", "start")
+
+    def __init__(self, lst, start):
+        self.lst = lst
+        self.start = start
+
+    def __len__(self):
+        return len(self.lst) - self.start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            if i.step is None and i.stop is None and (i.start or 0) >= 0:
+                return ListView(self.lst, min(self.start + (i.start or 0), len(self.lst)))
+            return self.lst[self.start:][i]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("list index out of range")
+        return self.lst[self.start + i]
+
+    def __iter__(self):
+        return islice(self.lst, self.start, None)
+
+    def __reversed__(self):
+        for i in range(len(self.lst) - 1, self.start - 1, -1):
+            yield self.lst[i]
+
+    def __add__(self, other):
+        return [*self, *other]
+
+    def __radd__(self, other):
+        return [*other, *self]
+
+    def __eq__(self, other):
+        return isinstance(other, (list, ListView)) and len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def list_tail(lst):
+    """lst[1:], without copying lst."""
+    if isinstance(lst, ListView):
+        return ListView(lst.lst, lst.start + 1)
+    return ListView(lst, 1)
+
+
+def AzorPrint(nums, stdout=None):
+    print(''.join([chr(n) for n in nums]), end='', file=stdout)
+
+
+def AzorInput(stdin=None):
+    if stdin is None:
+        s = input()
+    else:
+        s = stdin.readline()
+        if not s:
+            raise EOFError
+        s = s.rstrip("\n")
     return [ord(c) for c in s]
 
 
@@ -47,21 +111,170 @@ SIDE_EFFECT_FUNCTIONS = {
 }
 
 
+def native_concat(a, b):
+    return a + b
+
+
+def native_reverse(lst):
+    return lst[::-1]
+
+
+def native_map(f, lst):
+    return [f(x) for x in lst]
+
+
+def native_filter(p, lst):
+    return [x for x in lst if p(x)]
+
+
+def native_foldl(f, acc, lst):
+    for x in lst:
+        acc = f(acc, x)
+    return acc
+
+
+def native_foldr(f, acc, lst):
+    for x in reversed(lst):
+        acc = f(x, acc)
+    return acc
+
+
+def native_nth(lst, n, default):
+    return lst[n] if 0 <= n < len(lst) else default
+
+
+# Python implementations of stdlib functions, used in place of the Azor definitions of the same name when
+# those have exactly the expected type.
+NATIVE_FUNCTIONS = {
+    "len": (LEN_TYPE, len),
+    "concat": (CONCAT_TYPE, native_concat),
+    "append": (CONCAT_TYPE, native_concat),
+    "reverse": (REVERSE_TYPE, native_reverse),
+    "map": (MAP_TYPE, native_map),
+    "filter": (FILTER_TYPE, native_filter),
+    "foldl": (FOLDL_TYPE, native_foldl),
+    "foldr": (FOLDR_TYPE, native_foldr),
+    "sum": (SUM_TYPE, sum),
+    "nth": (NTH_TYPE, native_nth),
+}
+
+
+# natives which do their own integer arithmetic, and so only agree with Azor code in bigint mode
+ARITHMETIC_NATIVES = {"sum"}
+
+# natives which call the functions they are passed
+HIGHER_ORDER_NATIVES = {"map", "filter", "foldl", "foldr"}
+
+# natives which build a new list, by implementation, since specializations are bound to them under other labels
+LIST_NATIVES = {native_concat, native_reverse, native_map, native_filter}
+
+
+def native_bindings(labels, types: Dict[str, AzorType], arithmetic: Arithmetic = None):
+    """The native implementations which can stand in for the given (stdlib) declarations."""
+    bigint = arithmetic is None or arithmetic.mode == BIGINT
+    bindings = {}
+    for label in labels:
+        if label in NATIVE_FUNCTIONS and (bigint or label not in ARITHMETIC_NATIVES):
+            expected, fn = NATIVE_FUNCTIONS[label]
+            declared = types.get(label)
+            if declared is not None and same_type(declared.canonical(), expected.canonical()):
+                bindings[label] = fn
+    return bindings
+
+
 assert set(BINOPS.keys()) == set(BINOP_TYPES.keys())
 
 
 class Interpreter:
-    def __init__(self, stmts: List[Declaration]):
+    def __init__(self, stmts: List[Declaration], natives=None, arithmetic: Arithmetic = None, limits: Limits = None,
+                 stdin=None, stdout=None, unboxed_lets=None, looped_conses=None, fused_calls=None):
         self.stmts_by_label = {}
         for stmt in stmts:
             self.stmts_by_label[stmt.label.val] = stmt
 
-        self.symbol_table = {**SIDE_EFFECT_FUNCTIONS}
+        self.arithmetic = arithmetic or Arithmetic()
+        self.binops = self.arithmetic.binops
+        self.negate = self.arithmetic.negate
+
+        # limits that aren't set are infinite, so that each check is a single comparison
+        self.limits = limits or Limits()
+        self.max_steps = math.inf if self.limits.max_steps is None else self.limits.max_steps
+        self.max_depth = math.inf if self.limits.max_depth is None else self.limits.max_depth
+        self.max_cells = math.inf if self.limits.max_cells is None else self.limits.max_cells
+        self.deadline = None
+
+        self.natives = natives or {}
+        if self.limits.counts_work():
+            self.natives = {
+                label: self.charged(fn, self.stmts_by_label[label].label)
+                if fn in LIST_NATIVES and label in self.stmts_by_label else fn
+                for label, fn in self.natives.items()
+            }
+        self.symbol_table = {**SIDE_EFFECT_FUNCTIONS, **self.natives}
+        self.unboxed_lets = unboxable_lets(stmts) if unboxed_lets is None else unboxed_lets
+        self.looped_conses = loopable_conses(stmts) if looped_conses is None else looped_conses
+        # fusing needs the whole program's purity analysis, so it's only done when the caller has precomputed it
+        self.fused_calls = fused_calls or {}
+
+        self.stdin = stdin
+        self.stdout = stdout
+        if stdin is not None:
+            self.symbol_table["input"] = lambda: AzorInput(stdin)
+        if stdout is not None:
+            self.symbol_table["print"] = lambda nums: AzorPrint(nums, stdout)
+
+        self.steps = 0
+        self.depth = 0
+        self.peak_depth = 0
+        self.cells = 0
+        self.next_check = self.max_steps + 1
 
     def main(self, args):
+        if self.limits.timeout is not None:
+            self.deadline = time.monotonic() + self.limits.timeout
+            self.next_check = min(self.max_steps + 1, self.steps + CLOCK_INTERVAL)
+
         processed_args = [[ord(c) for c in arg] for arg in args]
         return self.evaluate_global("main")(processed_args)
 
+    def check_budgets(self, token: Token):
+        """Called once the step count reaches next_check."""
+        if self.steps > self.max_steps:
+            raise ResourceLimitExceeded(token, f"Exceeded the limit of {self.limits.max_steps} evaluation steps",
+                                        "steps")
+
+        if self.deadline is not None:
+            if time.monotonic() > self.deadline:
+                raise ResourceLimitExceeded(token, f"Exceeded the time limit of {self.limits.timeout}s", "time")
+            self.next_check = min(self.max_steps + 1, self.steps + CLOCK_INTERVAL)
+        else:
+            self.next_check = self.max_steps + 1
+
+    def depth_exceeded(self, token: Token):
+        return ResourceLimitExceeded(token, f"Exceeded the limit of {self.limits.max_depth} nested calls", "depth")
+
+    def allocate(self, cells, token: Token):
+        self.cells += cells
+        if self.cells > self.max_cells:
+            raise ResourceLimitExceeded(token, f"Exceeded the limit of {self.limits.max_cells} list cells", "cells")
+
+    def charged(self, fn, token: Token):
+        """fn, charging for each list it returns. token is the label of the declaration it stands in for."""
+        def native(*args):
+            return self.charge(fn(*args), token)
+        return native
+
+    def charge(self, result, token: Token):
+        """
+        Charges a step and the cells of a list a native returned, which the declaration it stands in for would have
+        allocated too, and returns it. A limit it exceeds is reported at token, that declaration's label.
+        """
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self.check_budgets(token)
+        self.allocate(len(result), token)
+        return result
+
     def evaluate_global(self, name):
         if name not in self.symbol_table:
             stmt = self.stmts_by_label[name]
@@ -79,6 +292,10 @@ class Interpreter:
         return self.symbol_table[name]
 
     def evaluate_expression(self, expr: Expression, env):
+        self.steps += 1
+        if self.steps >= self.next_check:
+            self.check_budgets(expr.token)
+
         try:
             return self.evaluate_expression_unsafe(expr, env)
         except RecursionError:
@@ -92,32 +309,44 @@ class Interpreter:
             return tuple(self.evaluate_expression(e, env) for e in expr.elements)
 
         elif expr.expr_type == Expression.LIST:
+            self.allocate(len(expr.elements), expr.token)
             return [self.evaluate_expression(e, env) for e in expr.elements]
 
         elif expr.expr_type == Expression.IF:
             return self.evaluate_if(expr, env)
 
         elif expr.expr_type == Expression.BINOP:
-            return BINOPS[expr.token.val](
-                self.evaluate_expression(expr.left, env),
-                self.evaluate_expression(expr.right, env),
-            )
+            left = self.evaluate_expression(expr.left, env)
+            right = self.evaluate_expression(expr.right, env)
+            try:
+                return self.binops[expr.token.val](left, right)
+            except ArithmeticError as e:
+                expr.token.raise_error(str(e))
 
         elif expr.expr_type == Expression.CONS:
-            return [
+            if id(expr) in self.looped_conses:
+                return self.evaluate_cons_loop(expr, env)
+            lst = [
                 self.evaluate_expression(expr.left, env),
                 *self.evaluate_expression(expr.right, env),
             ]
+            self.allocate(len(lst), expr.token)
+            return lst
 
         elif expr.expr_type == Expression.LET:
             return self.evaluate_let(expr, env)
 
         elif expr.expr_type == Expression.CALL:
+            if id(expr) in self.fused_calls:
+                return self.evaluate_fused(self.fused_calls[id(expr)], env)
+            if id(expr) in self.looped_conses and self.called_declaration(expr, env) is not None:
+                return self.evaluate_cons_loop(expr, env)
+
             callee = self.evaluate_expression(expr.left, env)
 
             args = [self.evaluate_expression(arg, env) for arg in expr.args.elements]
 
-            return callee(*args)
+            return self.call(callee, args, expr.token)
 
         elif expr.expr_type == Expression.GENERIC:
             return self.evaluate_expression(expr.left, env)
@@ -126,7 +355,11 @@ class Interpreter:
             if expr.token.ttype == '!':
                 return not self.evaluate_expression(expr.right, env)
             elif expr.token.s == '-':
-                return -self.evaluate_expression(expr.right, env)
+                value = self.evaluate_expression(expr.right, env)
+                try:
+                    return self.negate(value)
+                except ArithmeticError as e:
+                    expr.token.raise_error(str(e))
             else:
                 raise ValueError
 
@@ -151,7 +384,7 @@ class Interpreter:
             head, tail, lst_expr = expr.condition.left.left, expr.condition.left.right, expr.condition.right
             lst = self.evaluate_expression(lst_expr, env)
             if len(lst) > 0:
-                subenv = {**env, head.token.val: lst[0], tail.token.val: lst[1:]}
+                subenv = {**env, head.token.val: lst[0], tail.token.val: list_tail(lst)}
                 return self.evaluate_expression(expr.left, subenv)
             else:
                 return self.evaluate_expression(expr.right, env)
@@ -162,6 +395,21 @@ class Interpreter:
             else:
                 return self.evaluate_expression(expr.right, env)
 
+    def call(self, callee, args, token: Token):
+        """Calls callee with args as a call expression at token does, counting it as a nested call."""
+        self.depth += 1
+        try:
+            if self.depth > self.peak_depth:
+                if self.depth > self.max_depth:
+                    raise self.depth_exceeded(token)
+                self.peak_depth = self.depth
+            return callee(*args)
+        except EOFError:
+            # input ran out, which the program can't test for beforehand
+            token.raise_error("Reached the end of the input")
+        finally:
+            self.depth -= 1
+
     def evaluate_let(self, expr, env):
         dest, source = expr.left.left, expr.left.right
 
@@ -172,11 +420,242 @@ class Interpreter:
 
         elif dest.expr_type == Expression.TUPLE:
             subenv = {**env}
-            t = self.evaluate_expression(source, env)
-            for label_expr, val in zip(dest.elements, t):
-                subenv[label_expr.token.val] = val
+            labels = [label_expr.token.val for label_expr in dest.elements]
+            if id(expr) in self.unboxed_lets:
+                self.evaluate_unboxed(source, env, labels, subenv)
+            else:
+                t = self.evaluate_expression(source, env)
+                for label, val in zip(labels, t):
+                    subenv[label] = val
 
         else:
             raise ValueError
 
         return self.evaluate_expression(expr.right, subenv)
+
+    def evaluate_unboxed(self, expr: Expression, env, labels, dest):
+        """
+        Evaluates expr, which must produce a tuple, binding its elements to labels in dest. Tuples built in tail
+        position, including those of tail calls to other functions, are never allocated.
+        """
+        # calls entered by the loop count as nested until it returns, as they would if they recursed
+        entered = 0
+        try:
+            while True:
+                stmt = self.called_declaration(expr, env) if expr.expr_type == Expression.CALL else None
+
+                if expr.expr_type == Expression.TUPLE:
+                    self.visit(expr)
+                    for label, e in zip(labels, expr.elements):
+                        dest[label] = self.evaluate_expression(e, env)
+                    return
+
+                elif expr.expr_type == Expression.IF:
+                    self.visit(expr)
+                    if expr.condition.expr_type == Expression.ARROW:
+                        head, tail, lst_expr = expr.condition.left.left, expr.condition.left.right, expr.condition.right
+                        lst = self.evaluate_expression(lst_expr, env)
+                        if len(lst) > 0:
+                            env = {**env, head.token.val: lst[0], tail.token.val: list_tail(lst)}
+                            expr = expr.left
+                        else:
+                            expr = expr.right
+                    elif self.evaluate_expression(expr.condition, env):
+                        expr = expr.left
+                    else:
+                        expr = expr.right
+
+                elif expr.expr_type == Expression.LET and expr.left.left.expr_type == Expression.SIMPLE:
+                    self.visit(expr)
+                    env = {**env, expr.left.left.token.val: self.evaluate_expression(expr.left.right, env)}
+                    expr = expr.right
+
+                elif stmt is not None:
+                    self.visit(expr)
+                    args = [self.evaluate_expression(arg, env) for arg in expr.args.elements]
+                    self.enter(expr)
+                    self.depth += 1
+                    entered += 1
+                    if self.depth > self.peak_depth:
+                        if self.depth > self.max_depth:
+                            raise self.depth_exceeded(expr.token)
+                        self.peak_depth = self.depth
+                    env = dict(zip(stmt.typehint.argnames, args))
+                    expr = stmt.rhs
+
+                else:
+                    t = self.evaluate_expression(expr, env)
+                    for label, val in zip(labels, t):
+                        dest[label] = val
+                    return
+        finally:
+            self.depth -= entered
+
+    def evaluate_cons_loop(self, expr: Expression, env):
+        """
+        Evaluates a ~ expression, or a tail call leading to one, by appending each head to a single result list while
+        following its tail through further ~, ifs, lets and calls of declared functions, which are entered without
+        growing the stack. This is tail recursion modulo cons: list-building recursion runs in constant stack, and in
+        linear time.
+        """
+        out = []
+        # calls entered by the loop count as nested until it returns, as they would if they recursed
+        entered = 0
+        # the ~ or call the loop starts at was visited by evaluate_expression
+        looped = False
+        try:
+            while True:
+                self.steps += 1
+                if self.steps >= self.next_check:
+                    self.check_budgets(expr.token)
+                stmt = self.called_declaration(expr, env) if expr.expr_type == Expression.CALL else None
+
+                if expr.expr_type == Expression.CONS:
+                    if looped:
+                        self.visit(expr)
+                    out.append(self.evaluate_expression(expr.left, env))
+                    self.allocate(1, expr.token)
+                    expr = expr.right
+
+                elif expr.expr_type == Expression.IF:
+                    self.visit(expr)
+                    if expr.condition.expr_type == Expression.ARROW:
+                        head, tail, lst_expr = expr.condition.left.left, expr.condition.left.right, expr.condition.right
+                        lst = self.evaluate_expression(lst_expr, env)
+                        if len(lst) > 0:
+                            env = {**env, head.token.val: lst[0], tail.token.val: list_tail(lst)}
+                            expr = expr.left
+                        else:
+                            expr = expr.right
+                    elif self.evaluate_expression(expr.condition, env):
+                        expr = expr.left
+                    else:
+                        expr = expr.right
+
+                elif expr.expr_type == Expression.LET and expr.left.left.expr_type == Expression.SIMPLE:
+                    self.visit(expr)
+                    env = {**env, expr.left.left.token.val: self.evaluate_expression(expr.left.right, env)}
+                    expr = expr.right
+
+                elif stmt is not None:
+                    if looped:
+                        self.visit(expr)
+                    args = [self.evaluate_expression(arg, env) for arg in expr.args.elements]
+                    self.enter(expr)
+                    self.depth += 1
+                    entered += 1
+                    if self.depth > self.peak_depth:
+                        if self.depth > self.max_depth:
+                            raise self.depth_exceeded(expr.token)
+                        self.peak_depth = self.depth
+                    env = dict(zip(stmt.typehint.argnames, args))
+                    expr = stmt.rhs
+
+                else:
+                    tail = self.evaluate_expression(expr, env)
+                    return self.prepend(out, tail, expr.token) if out else tail
+                looped = True
+        finally:
+            self.depth -= entered
+
+    def visit(self, expr: Expression):
+        """
+        Called with each expression evaluate_unboxed and evaluate_cons_loop evaluate themselves rather than through
+        evaluate_expression, for interpreters which watch what is evaluated.
+        """
+
+    def enter(self, expr: Expression):
+        """
+        Called with each call through which evaluate_unboxed and evaluate_cons_loop enter a declared function
+        without evaluating its name or calling it, once its arguments are evaluated.
+        """
+
+    def prepend(self, heads: list, tail, token: Token):
+        """The list of heads followed by tail, which evaluate_cons_loop ends with. heads may be reused."""
+        self.allocate(len(tail), token)
+        heads.extend(tail)
+        return heads
+
+    def called_declaration(self, expr: Expression, env):
+        """The function declaration a call statically refers to, if any."""
+        callee = expr.left
+        while callee.expr_type == Expression.GENERIC:
+            callee = callee.left
+        label = callee.token.val
+        if callee.expr_type == Expression.SIMPLE and callee.token.ttype == "LABEL" and label not in env \
+                and label not in self.natives and id(expr) not in self.fused_calls:
+            stmt = self.stmts_by_label.get(label)
+            if stmt is not None and stmt.typehint.argnames is not None:
+                return stmt
+        return None
+
+    def evaluate_fused(self, fused: FusedCall, env):
+        """
+        Evaluates a chain of list traversals as one pass over its source list. Each map and filter stage is a
+        generator over the one inside it, so elements flow through every stage one at a time and no intermediate
+        list is built; only the outermost stage's result is.
+        """
+        stage_envs = []
+        for shape, call in fused.stages:
+            args = call.args.elements
+            stage_envs.append({
+                name: self.evaluate_expression(args[i], env)
+                for i, name in enumerate(shape.argnames) if i != shape.list_index
+            })
+        values = self.evaluate_expression(fused.source, env)
+
+        self.depth += 1
+        try:
+            if self.depth > self.peak_depth:
+                if self.depth > self.max_depth:
+                    raise self.depth_exceeded(fused.expr.token)
+                self.peak_depth = self.depth
+
+            for (shape, _), stage_env in reversed(list(zip(fused.stages[1:], stage_envs[1:]))):
+                values = self.fused_stage(shape, stage_env, values)
+
+            shape, _ = fused.stages[0]
+            stage_env = stage_envs[0]
+            if shape.kind == FOLDL:
+                acc = stage_env[shape.acc]
+                if shape.direct is not None:
+                    f = stage_env[shape.direct]
+                    for x in values:
+                        acc = f(acc, x)
+                else:
+                    for x in values:
+                        acc = self.evaluate_expression(shape.element, {**stage_env, shape.acc: acc, shape.head: x})
+                return acc
+
+            elif shape.kind in (MAP, FILTER):
+                out = list(self.fused_stage(shape, stage_env, values))
+                self.allocate(len(out), fused.expr.token)
+                return out
+
+            else:
+                # a right fold combines elements last to first, so their operands are gathered first
+                lefts = [self.evaluate_expression(shape.element, {**stage_env, shape.head: x}) for x in values]
+                binop = self.binops[shape.op.val]
+                acc = self.evaluate_expression(shape.empty, stage_env)
+                try:
+                    for left in reversed(lefts):
+                        acc = binop(left, acc)
+                except ArithmeticError as e:
+                    shape.op.raise_error(str(e))
+                return acc
+
+        finally:
+            self.depth -= 1
+
+    def fused_stage(self, shape, stage_env, values):
+        """A generator of the elements of values mapped or filtered by a map or filter stage."""
+        if shape.direct is not None:
+            f = stage_env[shape.direct]
+            return map(f, values) if shape.kind == MAP else filter(f, values)
+
+        def element(x):
+            return self.evaluate_expression(shape.element, {**stage_env, shape.head: x})
+
+        if shape.kind == MAP:
+            return map(element, values)
+        return filter(element, values)
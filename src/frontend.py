@@ -0,0 +1,94 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, List, TextIO, Tuple
+
+from .ast import Declaration
+from .tokens import Token, Tokenizer, source_lines
+from .parser import Parser
+from .analysis import walk
+from .stats import Stats
+
+# Sources smaller than this many characters in total are tokenized in this process, since starting a pool costs
+# more than it saves.
+MIN_PARALLEL_SIZE = 200000
+
+# lines scanned by a worker at a time
+CHUNK_LINES = 1000
+
+# chunks submitted to the pool ahead of the one being parsed, per worker
+CHUNKS_AHEAD = 2
+
+
+def _scan_chunk(lines: List[str], first_line_no: int):
+    return Tokenizer(lines, first_line_no).scan()
+
+
+def line_chunks(lines: Iterable[str]):
+    """Yields (first_line_no, lines) for successive chunks of CHUNK_LINES lines."""
+    lines = iter(lines)
+    line_no = 0
+    while True:
+        chunk = list(islice(lines, CHUNK_LINES))
+        if not chunk:
+            return
+        yield line_no, chunk
+        line_no += len(chunk)
+
+
+def scan_in_pool(lines: Iterable[str], pool: ProcessPoolExecutor, workers: int):
+    """
+    Yields the tokens of lines in order, having workers scan them in chunks. Tokens never span lines, so any line
+    range can be scanned independently. Workers classify the tokens too, and send back (line_no, col_no, s, ttype,
+    val) tuples rather than Tokens, since unpickling that many objects would cost as much as tokenizing them here.
+    Only a few chunks are read ahead of the consumer, so the whole source is never in memory at once.
+    """
+    chunks = line_chunks(lines)
+    pending = deque()
+
+    def submit(n):
+        for first_line_no, chunk in islice(chunks, n):
+            pending.append((first_line_no, chunk, pool.submit(_scan_chunk, chunk, first_line_no)))
+
+    submit(workers * CHUNKS_AHEAD)
+    while pending:
+        first_line_no, chunk, future = pending.popleft()
+        submit(1)
+        for line_no, col_no, s, ttype, val in future.result():
+            yield Token(chunk[line_no - first_line_no], line_no, col_no, s, (ttype, val))
+
+
+def parse_streams(streams: List[TextIO], sizes: List[int], stats: Stats,
+                  workers=None) -> List[Tuple[List[Declaration], List[Token]]]:
+    """
+    Tokenizes and parses several sources, returning the declarations and the imported module names of each. Each
+    source is read a line at a time and parsed as its tokens arrive, so it is never held in memory as a whole. When
+    the sources are large, tokenizing, which is most of the work, is spread over workers processes. Parsing stays
+    in this process, because unpickling a syntax tree costs more than building it.
+
+    Since tokenizing and parsing are interleaved, the time for both is recorded as the parse phase.
+    """
+    workers = workers or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(workers) if workers > 1 and sum(sizes) >= MIN_PARALLEL_SIZE else None
+
+    try:
+        parsed = []
+        for stream in streams:
+            lines = source_lines(stream)
+            tokens = scan_in_pool(lines, pool, workers) if pool is not None else Tokenizer(lines).iter_tokens()
+            parser = Parser(tokens)
+
+            with stats.phase("parse"):
+                stmts = parser.parse()
+
+            stats.count("tokens", parser.tokens_read)
+            stats.count("declarations", len(stmts))
+            stats.count("nodes", sum(1 for stmt in stmts for _ in walk(stmt.rhs)))
+            parsed.append((stmts, parser.imports))
+
+        return parsed
+
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
@@ -0,0 +1,217 @@
+from typing import Dict, List, Set
+
+from .ast import Declaration, Expression, TypeNode
+from .analysis import ProgramAnalysis, walk, free_locals, global_references
+
+# How a declaration traverses its list argument:
+#   MAP     if h ~ t <- l then X ~ f(..., t) else []
+#   FILTER  if h ~ t <- l then (if X then h ~ f(..., t) else f(..., t)) else []
+#   FOLDL   if h ~ t <- l then f(..., X, ..., t) else acc
+#   FOLDR   if h ~ t <- l then X op f(..., t) else E
+# where the other arguments of the recursive call are the declaration's own parameters, unchanged, and X reads
+# neither t nor l.
+MAP = "map"
+FILTER = "filter"
+FOLDL = "foldl"
+FOLDR = "foldr"
+
+# shapes which produce a list of the same length or shorter, and so can feed another stage
+TRANSFORMERS = {MAP, FILTER}
+
+
+def unwrap_generic(expr: Expression) -> Expression:
+    while expr.expr_type == Expression.GENERIC:
+        expr = expr.left
+    return expr
+
+
+def labels_in(expr: Expression) -> Set[str]:
+    return {e.token.val for e in walk(expr) if e.expr_type == Expression.SIMPLE and e.token.ttype == "LABEL"}
+
+
+def holds_function(typenode: TypeNode) -> bool:
+    """Whether a value of this type could be, or contain, a function. Generic types could be anything."""
+    if typenode.argtypes is not None or typenode.ttype == TypeNode.GENERIC:
+        return True
+    elif typenode.ttype == TypeNode.LIST:
+        return holds_function(typenode.etype)
+    elif typenode.ttype == TypeNode.TUPLE:
+        return any(holds_function(t) for t in typenode.constituents)
+    return False
+
+
+class Shape:
+    """A declaration which traverses one of its arguments as a list, in one of the shapes above."""
+
+    def __init__(self, kind, stmt: Declaration, list_index, head, element: Expression, acc_index=None,
+                 empty: Expression = None, op=None):
+        self.kind = kind
+        self.label = stmt.label.val
+        self.argnames = stmt.typehint.argnames
+        self.list_index = list_index
+        self.head = head
+        # X: the mapped value, the filter condition, the next accumulator, or the left operand of op
+        self.element = element
+        self.acc_index = acc_index
+        self.acc = None if acc_index is None else self.argnames[acc_index]
+        self.empty = empty
+        self.op = op
+
+        # the parameter called when X is just a call of a parameter on the head (and accumulator, for FOLDL),
+        # in which case the function can be applied to elements directly
+        self.direct = None
+        if element.expr_type == Expression.CALL:
+            callee = unwrap_generic(element.left)
+            args = [a.token.val if a.expr_type == Expression.SIMPLE else None for a in element.args.elements]
+            expected = [self.acc, head] if kind == FOLDL else [head]
+            if callee.expr_type == Expression.SIMPLE and callee.token.val in self.invariants() and args == expected:
+                self.direct = callee.token.val
+
+    def invariants(self) -> List[str]:
+        """The parameters passed unchanged to every level of the recursion."""
+        return [name for i, name in enumerate(self.argnames) if i != self.list_index and i != self.acc_index]
+
+    def is_pure(self, analysis: ProgramAnalysis) -> bool:
+        """
+        Whether X can only call pure globals and the functions passed as invariant parameters, so that evaluating
+        it for each element interleaved with other stages is unobservable, provided those functions are pure.
+        """
+        for expr in (self.element, self.empty):
+            if expr is None:
+                continue
+            if global_references(expr, analysis.global_names) & analysis.impure:
+                return False
+            for e in walk(expr):
+                if e.expr_type == Expression.CALL:
+                    callee = unwrap_generic(e.left)
+                    if callee.expr_type != Expression.SIMPLE or not (
+                            callee.token.val in analysis.global_names or callee.token.val in self.invariants()):
+                        return False
+        return True
+
+
+def traversal_shape(stmt: Declaration):
+    """The Shape of stmt, or None if it doesn't have one."""
+    argnames = stmt.typehint.argnames
+    body = stmt.rhs
+    if argnames is None or body.expr_type != Expression.IF or body.condition.expr_type != Expression.ARROW:
+        return None
+
+    source = body.condition.right
+    if source.expr_type != Expression.SIMPLE or source.token.val not in argnames:
+        return None
+    list_index = argnames.index(source.token.val)
+    head = body.condition.left.left.token.val
+    tail = body.condition.left.right.token.val
+    then, otherwise = body.left, body.right
+
+    def is_step(e: Expression, changed=None):
+        if e.expr_type != Expression.CALL:
+            return False
+        callee = unwrap_generic(e.left)
+        if callee.expr_type != Expression.SIMPLE or callee.token.val != stmt.label.val:
+            return False
+        if len(e.args.elements) != len(argnames):
+            return False
+        for i, (arg, name) in enumerate(zip(e.args.elements, argnames)):
+            if i == changed:
+                continue
+            expected = tail if i == list_index else name
+            if arg.expr_type != Expression.SIMPLE or arg.token.val != expected:
+                return False
+        return True
+
+    def is_element(e: Expression):
+        return not labels_in(e) & {tail, source.token.val}
+
+    def is_empty_list(e: Expression):
+        return e.expr_type == Expression.LIST and len(e.elements) == 0
+
+    if then.expr_type == Expression.CONS and is_step(then.right) and is_element(then.left) \
+            and is_empty_list(otherwise):
+        return Shape(MAP, stmt, list_index, head, then.left)
+
+    if then.expr_type == Expression.IF and then.condition.expr_type != Expression.ARROW \
+            and then.left.expr_type == Expression.CONS and then.left.left.expr_type == Expression.SIMPLE \
+            and then.left.left.token.val == head and is_step(then.left.right) and is_step(then.right) \
+            and is_element(then.condition) and is_empty_list(otherwise):
+        return Shape(FILTER, stmt, list_index, head, then.condition)
+
+    if otherwise.expr_type == Expression.SIMPLE and otherwise.token.val in argnames:
+        acc_index = argnames.index(otherwise.token.val)
+        if acc_index != list_index and is_step(then, acc_index) and is_element(then.args.elements[acc_index]):
+            return Shape(FOLDL, stmt, list_index, head, then.args.elements[acc_index], acc_index=acc_index)
+
+    if then.expr_type == Expression.BINOP and is_step(then.right) and is_element(then.left) \
+            and not labels_in(otherwise) & {head, tail, source.token.val}:
+        return Shape(FOLDR, stmt, list_index, head, then.left, empty=otherwise, op=then.token)
+
+    return None
+
+
+class FusedCall:
+    """
+    A call of a list traversal whose list argument is built by a chain of map- and filter-shaped calls. It is
+    evaluated as one pass over the innermost list, with no intermediate lists built.
+    """
+
+    def __init__(self, expr: Expression, stages: List[tuple], source: Expression):
+        self.expr = expr
+        # (Shape, call expression), outermost first
+        self.stages = stages
+        self.source = source
+
+    def describe(self):
+        token = self.expr.token
+        labels = " <- ".join(shape.label for shape, _ in self.stages)
+        return f"{token.line_no + 1}:{token.col_no + 1}: fused {labels}"
+
+
+def fusible_calls(stmts: List[Declaration]) -> Dict[int, FusedCall]:
+    """
+    The ids of calls which can be evaluated as a FusedCall. Fusing interleaves the stages' work on each element,
+    so every stage must be pure, and so must the functions passed to it. Those are checked where possible: a
+    function argument must be a pure expression whose only locals are parameters of the enclosing declaration
+    with types that can't hold a function.
+    """
+    analysis = ProgramAnalysis(stmts)
+    shapes = {}
+    for stmt in stmts:
+        shape = traversal_shape(stmt)
+        if shape is not None and shape.is_pure(analysis):
+            shapes[shape.label] = shape
+
+    out = {}
+    for stmt in stmts:
+        typehint = stmt.typehint
+        plain_params = set()
+        if typehint.argnames is not None:
+            plain_params = {name for name, t in zip(typehint.argnames, typehint.argtypes) if not holds_function(t)}
+
+        def is_safe(arg: Expression):
+            return analysis.is_pure(arg) and free_locals(arg, analysis.global_names) <= plain_params
+
+        fused_inner = set()
+        for e in walk(stmt.rhs):
+            if e.expr_type != Expression.CALL or id(e) in fused_inner:
+                continue
+
+            stages = []
+            call = e
+            while call.expr_type == Expression.CALL:
+                callee = unwrap_generic(call.left)
+                shape = shapes.get(callee.token.val) if callee.expr_type == Expression.SIMPLE else None
+                if shape is None or (stages and shape.kind not in TRANSFORMERS):
+                    break
+                args = call.args.elements
+                if len(args) != len(shape.argnames) or not all(
+                        is_safe(arg) for i, arg in enumerate(args) if i != shape.list_index):
+                    break
+                stages.append((shape, call))
+                call = args[shape.list_index]
+
+            if len(stages) > 1:
+                out[id(e)] = FusedCall(e, stages, call)
+                fused_inner |= {id(c) for _, c in stages}
+
+    return out
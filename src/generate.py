@@ -0,0 +1,146 @@
+import random
+from typing import List
+
+# results of generated integer functions are kept below this, so values stay small however deep the calls go
+MODULUS = 1009
+
+# the depth of the expressions evaluated many times per run: the result of an integer function whose fuel has run
+# out, and the element a list function maps to. It is fixed so that the run time follows the size of the program
+# rather than its square as depth grows
+BASE_DEPTH = 2
+
+
+class ProgramGenerator:
+    """
+    Generates valid, well-typed Azor programs of a chosen size and shape, for testing the front end and interpreter
+    at scale. The same parameters and seed always give the same program.
+
+    There are three kinds of declaration: integer functions f<i>(n, x), whose bodies are random expressions of up
+    to depth levels; generic functions g<i>{T}, which are called at INT in place of an expression node with
+    probability generic_ratio; and list functions l<i>(xs, k), which map each element of a list to an expression
+    of BASE_DEPTH levels. f<i> calls fan_out of the functions after it while its fuel n is positive, and returns
+    an expression of BASE_DEPTH levels once it has run out. main calls every integer function with a fuel of 1,
+    so each call in its body costs the same whatever the depth, and applies every list function to a list of
+    list_size elements. The run time therefore grows linearly with the number of declarations and with list_size,
+    and no faster than the size of the program as depth grows.
+    """
+
+    def __init__(self, declarations=100, depth=4, generic_ratio=0.2, fan_out=3, list_size=100, seed=0):
+        self.declarations = max(declarations, 3)
+        self.depth = depth
+        self.generic_ratio = generic_ratio
+        self.fan_out = fan_out
+        self.list_size = list_size
+        self.random = random.Random(seed)
+
+        n_generic = max(1, self.declarations // 10)
+        n_list = max(1, self.declarations // 10)
+        n_int = self.declarations - n_generic - n_list
+        self.int_functions = [f"f{i}" for i in range(n_int)]
+        self.generic_functions = [f"g{i}" for i in range(n_generic)]
+        self.list_functions = [f"l{i}" for i in range(n_list)]
+
+        self.locals: List[str] = []
+        self.lets = 0
+        self.callees: List[str] = []
+
+    def generate(self) -> str:
+        decls = []
+        for i, label in enumerate(self.generic_functions):
+            decls.append(self.generic_function(i, label))
+        for i, label in enumerate(self.int_functions):
+            decls.append(self.int_function(i, label))
+        for label in self.list_functions:
+            decls.append(self.list_function(label))
+        decls.append(self.main())
+        return "\n\n".join(decls) + "\n"
+
+    def generic_function(self, i, label):
+        if i % 2 == 0:
+            return f"{label}{{T}} : T(c : BOOL, a : T, b : T) = if c then a else b"
+        return f"{label}{{T}} : T(c : BOOL, a : T, b : T) = if c then b else a"
+
+    def int_function(self, i, label):
+        self.locals = ["n", "x"]
+        self.lets = 0
+        self.callees = self.int_functions[i + 1:i + 1 + self.fan_out * 4]
+        self.random.shuffle(self.callees)
+        self.callees = self.callees[:self.fan_out]
+
+        base = self.expression(min(self.depth, BASE_DEPTH), calls=False)
+        if not self.callees:
+            return f"{label} : INT(n : INT, x : INT) = ({base}) % {MODULUS}"
+
+        recursive = self.expression(self.depth, calls=True)
+        for callee in self.callees:
+            # every callee is called at least once, so the call graph has the fan-out asked for
+            recursive = f"({recursive} + {callee}((n - 1), {self.leaf()}))"
+        return f"{label} : INT(n : INT, x : INT) = if n > 0 then ({recursive}) % {MODULUS} else ({base}) % {MODULUS}"
+
+    def list_function(self, label):
+        self.locals = ["k", "hd"]
+        self.lets = 0
+        self.callees = self.int_functions[:self.fan_out]
+        element = self.expression(min(self.depth, BASE_DEPTH), calls=True, fuel="0")
+        return f"{label} : [INT](xs : [INT], k : INT) = if hd ~ tl <- xs then (({element}) % {MODULUS}) ~ " \
+               f"{label}(tl, k) else [] of INT"
+
+    def leaf(self):
+        if self.random.random() < 0.6:
+            return self.random.choice(self.locals)
+        return str(self.random.randint(0, 99))
+
+    def condition(self, depth, calls, fuel):
+        op = self.random.choice(["<", ">", "<=", ">=", "==", "!="])
+        return f"({self.expression(depth - 1, calls, fuel)} {op} {self.expression(depth - 1, calls, fuel)})"
+
+    def expression(self, depth, calls, fuel="(n - 1)") -> str:
+        """An INT expression of at most depth levels, reading only self.locals."""
+        if depth <= 0:
+            return self.leaf()
+
+        if self.random.random() < self.generic_ratio:
+            generic = self.random.choice(self.generic_functions)
+            return f"{generic}{{INT}}({self.condition(depth, calls, fuel)}, " \
+                   f"{self.expression(depth - 1, calls, fuel)}, {self.expression(depth - 1, calls, fuel)})"
+
+        r = self.random.random()
+        if calls and self.callees and r < 0.2:
+            callee = self.random.choice(self.callees)
+            return f"{callee}({fuel}, {self.expression(depth - 1, calls, fuel)})"
+        elif r < 0.35:
+            return f"(if {self.condition(depth, calls, fuel)} then {self.expression(depth - 1, calls, fuel)} " \
+                   f"else {self.expression(depth - 1, calls, fuel)})"
+        elif r < 0.45:
+            value = self.expression(depth - 1, calls, fuel)
+            # Azor forbids duplicate local names, so each let in a declaration gets a new one
+            name = f"v{self.lets}"
+            self.lets += 1
+            self.locals.append(name)
+            body = self.expression(depth - 1, calls, fuel)
+            self.locals.remove(name)
+            return f"(let {name} <- {value} in {body})"
+        else:
+            op = self.random.choice(["+", "-", "*", "%"])
+            if op == "%":
+                right = str(self.random.randint(1, 97))
+            else:
+                right = self.expression(depth - 1, calls, fuel)
+            return f"({self.expression(depth - 1, calls, fuel)} {op} {right})"
+
+    def main(self):
+        calls = [f"{label}(1, {j % 97})" for j, label in enumerate(self.int_functions)]
+        calls += [f"sum({label}(range(0, {self.list_size}), {j}))" for j, label in enumerate(self.list_functions)]
+        return f"main : INT(args : [[INT]]) =\n    let r <- println(show(({balanced_sum(calls)}) % {MODULUS})) in 0"
+
+
+def balanced_sum(terms: List[str]) -> str:
+    """terms added up in a balanced tree, so that the expression is only logarithmically deep."""
+    if len(terms) == 1:
+        return terms[0]
+    mid = len(terms) // 2
+    return f"({balanced_sum(terms[:mid])} + {balanced_sum(terms[mid:])})"
+
+
+def generate_program(declarations=100, depth=4, generic_ratio=0.2, fan_out=3, list_size=100, seed=0) -> str:
+    return ProgramGenerator(declarations, depth, generic_ratio, fan_out, list_size, seed).generate()
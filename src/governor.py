@@ -0,0 +1,37 @@
+from .tokens import AzorError
+
+# how many evaluation steps pass between checks of the clock
+CLOCK_INTERVAL = 1024
+
+
+class ResourceLimitExceeded(AzorError):
+    """Raised when a run exceeds one of its Limits. limit is one of "steps", "depth", "cells" or "time"."""
+
+    def __init__(self, token, message, limit):
+        super().__init__(token, message)
+        self.args = (token, message, limit)
+        self.limit = limit
+
+
+class Limits:
+    """
+    Budgets for a single run, each of which is unlimited when None:
+
+    max_steps: the number of expressions evaluated
+    max_depth: the number of nested function calls
+    max_cells: the number of list cells allocated by the interpreter
+    timeout: wall-clock seconds
+    """
+
+    def __init__(self, max_steps=None, max_depth=None, max_cells=None, timeout=None):
+        self.max_steps = max_steps
+        self.max_depth = max_depth
+        self.max_cells = max_cells
+        self.timeout = timeout
+
+    def counts_work(self) -> bool:
+        """
+        Whether the steps, depth or cells of a run are limited. A run which skips work, by reusing values computed
+        by another, then doesn't fail where it would have.
+        """
+        return self.max_steps is not None or self.max_depth is not None or self.max_cells is not None
@@ -0,0 +1,188 @@
+import weakref
+from collections.abc import Sequence
+from typing import List
+
+from .ast import Declaration, Expression
+from .tokens import Token
+from .evaluate import Interpreter, ListView
+
+
+class Spine(list):
+    """
+    The elements of InternedLists, last element first, so that consing onto the longest of them is an append. base
+    is the spine this one was copied from, if any, which its key in the ValueTable refers to.
+    """
+    __slots__ = ("base", "__weakref__")
+
+
+class InternedList(Sequence):
+    """
+    A list owned by a ValueTable: the first n elements of spine, read backwards. Its tail is the first n - 1 of the
+    same spine, so lists consed onto a tail share its storage. Two non-empty InternedLists are the same value
+    exactly when they have the same spine and length.
+    """
+    __slots__ = ("spine", "n")
+
+    def __init__(self, spine: Spine, n: int):
+        self.spine = spine
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            if i.step is None and i.stop is None and (i.start or 0) >= 0:
+                return InternedList(self.spine, max(self.n - (i.start or 0), 0))
+            return list(self)[i]
+        if i < 0:
+            i += self.n
+        if not 0 <= i < self.n:
+            raise IndexError("list index out of range")
+        return self.spine[self.n - 1 - i]
+
+    def __iter__(self):
+        return map(self.spine.__getitem__, range(self.n - 1, -1, -1))
+
+    def __reversed__(self):
+        return iter(self.spine[:self.n])
+
+    def __add__(self, other):
+        return [*self, *other]
+
+    def __radd__(self, other):
+        return [*other, *self]
+
+    def __eq__(self, other):
+        if isinstance(other, InternedList) and other.spine is self.spine:
+            return other.n == self.n
+        return isinstance(other, (list, ListView, InternedList)) and len(self) == len(other) and all(
+            a == b for a, b in zip(self, other))
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class ValueTable:
+    """
+    Hash-consed Azor lists. A list is a cons cell, identified by its head and the identity of its tail, so every
+    list value built while another equal one is alive is stored once, lists share whatever suffixes they have in
+    common, and consing onto an interned list takes constant time.
+
+    Consing h onto the first n elements of a spine reuses the spine if its element n is already h, and appends h
+    if the spine has only n elements. Otherwise the n elements are copied into a new spine, which is kept in forks
+    under h, the spine and n, so the same cons finds it again. forks only holds weak references, so a spine is
+    dropped from it as soon as nothing else uses it, and a spine keeps the one it was copied from alive, so no
+    other object can have the id in its key. Lists consed onto the empty list always start a new spine.
+
+    Keys record elements' types as well as their values, because True == 1 in Python. CPython can't weakly
+    reference tuples, so a tuple is keyed by its contents.
+    """
+
+    def __init__(self):
+        self.forks = weakref.WeakValueDictionary()
+        self.empty = InternedList(Spine(), 0)
+        self.hits = 0
+        self.misses = 0
+
+    def canonical(self, value):
+        """value with every list inside it interned."""
+        t = type(value)
+        if t is list or t is ListView:
+            return self.intern(value)
+        elif t is tuple:
+            return tuple([self.canonical(v) for v in value])
+        return value
+
+    def element_key(self, value):
+        # value must be canonical, so that every spine in it is kept alive by whatever holds it
+        t = type(value)
+        if t is int or t is bool:
+            return t, value
+        elif t is tuple:
+            return tuple, self.key(value)
+        elif t is InternedList:
+            return (t, id(value.spine), value.n) if value.n else (t,)
+        else:
+            return None, id(value)
+
+    def key(self, values):
+        return tuple(self.element_key(value) for value in values)
+
+    def intern(self, values) -> InternedList:
+        if type(values) is InternedList:
+            return values
+        if type(values) is ListView and type(values.lst) is InternedList:
+            # a tail matched out of an interned list is already one
+            return values.lst[values.start:]
+        return self.prepend(list(values), self.empty)
+
+    def prepend(self, heads: list, tail) -> InternedList:
+        """The interned list of heads followed by tail, in time linear in len(heads)."""
+        tail = self.intern(tail)
+        for head in reversed(heads):
+            tail = self.cons(head, tail)
+        return tail
+
+    def cons(self, head, tail) -> InternedList:
+        head = self.canonical(head)
+        tail = self.intern(tail)
+        spine, n = tail.spine, tail.n
+        head_key = self.element_key(head)
+
+        if n and len(spine) > n and self.element_key(spine[n]) == head_key:
+            self.hits += 1
+            return InternedList(spine, n + 1)
+        if n and len(spine) == n:
+            self.misses += 1
+            spine.append(head)
+            return InternedList(spine, n + 1)
+
+        key = (head_key, id(spine), n) if n else (head_key,)
+        found = self.forks.get(key)
+        if found is not None:
+            self.hits += 1
+            return InternedList(found, n + 1)
+
+        self.misses += 1
+        found = Spine(spine[:n])
+        found.append(head)
+        found.base = spine if n else None
+        self.forks[key] = found
+        return InternedList(found, n + 1)
+
+
+class InterningInterpreter(Interpreter):
+    """An interpreter which hash-conses every list built by a list literal, a string literal, or ~."""
+
+    def __init__(self, stmts: List[Declaration], natives=None, arithmetic=None, limits=None, unboxed_lets=None):
+        super().__init__(stmts, natives, arithmetic, limits, unboxed_lets=unboxed_lets)
+        self.values = ValueTable()
+        # string literals are interned once each, and kept alive for the whole run
+        self.strings = {}
+
+    def evaluate_expression_unsafe(self, expr: Expression, env):
+        if expr.expr_type == Expression.CONS and id(expr) not in self.looped_conses:
+            head = self.evaluate_expression(expr.left, env)
+            tail = self.evaluate_expression(expr.right, env)
+            self.allocate(1, expr.token)
+            return self.values.cons(head, tail)
+
+        elif expr.expr_type == Expression.LIST:
+            return self.values.intern(super().evaluate_expression_unsafe(expr, env))
+
+        return super().evaluate_expression_unsafe(expr, env)
+
+    def prepend(self, heads: list, tail, token: Token):
+        # the heads were allocated as they were evaluated, and the tail is shared rather than copied
+        return self.values.prepend(heads, tail)
+
+    def evaluate_simple(self, token: Token, env):
+        if token.ttype == "STRING":
+            if id(token) not in self.strings:
+                self.strings[id(token)] = self.values.intern(token.val)
+            return self.strings[id(token)]
+        return super().evaluate_simple(token, env)
@@ -0,0 +1,227 @@
+from typing import List
+
+from .ast import Declaration, Expression, TypeNode
+from .analysis import ProgramAnalysis, walk, children, global_references, free_locals, IMPURE_BUILTINS
+from .evaluate import Interpreter, list_tail, AzorPrint
+
+
+class Thunk:
+    """A suspended computation, evaluated at most once."""
+    __slots__ = ("fn", "value")
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.value = None
+
+    def force(self):
+        if self.fn is not None:
+            self.value = self.fn()
+            self.fn = None
+        return self.value
+
+
+class LazyCons:
+    """A list cell whose tail may not have been computed yet."""
+    __slots__ = ("head", "tail")
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+
+    def force_tail(self):
+        if isinstance(self.tail, Thunk):
+            self.tail = self.tail.force()
+        return self.tail
+
+
+def force_list(lst):
+    out = []
+    while isinstance(lst, LazyCons):
+        out.append(lst.head)
+        lst = lst.force_tail()
+    out += lst
+    return out
+
+
+def _type_nodes(node: TypeNode):
+    yield node
+    if node.ttype == TypeNode.LIST:
+        yield from _type_nodes(node.etype)
+    elif node.ttype == TypeNode.TUPLE:
+        for c in node.constituents:
+            yield from _type_nodes(c)
+    for a in node.argtypes or []:
+        yield from _type_nodes(a)
+
+
+def _stores_functions(node: TypeNode):
+    for n in _type_nodes(node):
+        contained = [n.etype] if n.ttype == TypeNode.LIST else (n.constituents if n.ttype == TypeNode.TUPLE else [])
+        if any(c.argtypes is not None for c in contained):
+            return True
+    return False
+
+
+def functions_escape(stmts: List[Declaration]) -> bool:
+    """
+    Whether function values might be stored in lists or tuples, bound by let, or returned. If they can't, then
+    every function value reaching an expression arrives through the arguments of the function it's in.
+    """
+    function_names = set(IMPURE_BUILTINS)
+    for stmt in stmts:
+        if stmt.typehint.argnames is not None:
+            function_names.add(stmt.label.val)
+            function_names |= {
+                name for name, t in zip(stmt.typehint.argnames, stmt.typehint.argtypes)
+                if t.argtypes is not None
+            }
+        if any(_stores_functions(t) for t in stmt.typehint.argtypes or []) or _stores_functions(stmt.typehint):
+            return True
+
+    def is_function(e):
+        while e.expr_type == Expression.GENERIC:
+            e = e.left
+        return e.expr_type == Expression.SIMPLE and e.token.ttype == "LABEL" and e.token.val in function_names
+
+    for stmt in stmts:
+        if is_function(stmt.rhs):
+            return True
+        for e in walk(stmt.rhs):
+            if e.expr_type == Expression.GENERIC and any(t.argtypes is not None or _stores_functions(t)
+                                                         for t in e.elements):
+                return True
+            if e.expr_type == Expression.LIST and e.typehint is not None and _stores_functions(e.typehint):
+                return True
+            allowed = {id(e.left), *map(id, e.args.elements)} if e.expr_type == Expression.CALL else set()
+            if e.expr_type == Expression.GENERIC:
+                allowed.add(id(e.left))
+            if any(is_function(c) and id(c) not in allowed for c in children(e)):
+                return True
+
+    return False
+
+
+class LazyInterpreter(Interpreter):
+    """
+    Call-by-need evaluation of let bindings and the tails of ~ expressions, which are suspended until
+    first used. Only pure expressions are suspended; anything which might print, read input or draw a
+    random number is evaluated in program order, as usual.
+
+    A suspension inside a higher-order function (say, the recursive tail of a map) is pure only if the
+    functions it was passed are, so that is checked at runtime against the set of globals which can't
+    reach a side effect.
+    """
+
+    def __init__(self, stmts: List[Declaration], arithmetic=None, limits=None, stdin=None, stdout=None):
+        # ~ is evaluated lazily, so never by the eager loop
+        super().__init__(stmts, arithmetic=arithmetic, limits=limits, stdin=stdin, stdout=stdout, looped_conses=set())
+        self.symbol_table["print"] = lambda nums: AzorPrint(force_list(nums), stdout)
+
+        analysis = ProgramAnalysis(stmts)
+        self.pure_globals = set(analysis.stmts_by_label) - analysis.effectful
+        self.pure_functions = set()
+        parametric = not functions_escape(stmts)
+
+        # maps suspendable expressions to the locals whose values must be checked before suspending
+        self.suspendable = {}
+        for stmt in stmts:
+            for e in walk(stmt.rhs):
+                if e.expr_type == Expression.LET:
+                    candidate = e.left.right
+                elif e.expr_type == Expression.CONS:
+                    candidate = e.right
+                else:
+                    continue
+
+                if analysis.is_pure(candidate):
+                    self.suspendable[id(candidate)] = ()
+                elif parametric and self.is_parametrically_pure(candidate, analysis):
+                    self.suspendable[id(candidate)] = tuple(free_locals(candidate, analysis.global_names))
+
+    @staticmethod
+    def is_parametrically_pure(expr: Expression, analysis: ProgramAnalysis):
+        """Pure, provided that the function-valued locals it reads are."""
+        if global_references(expr, analysis.global_names) & analysis.effectful:
+            return False
+        free = free_locals(expr, analysis.global_names)
+        for e in walk(expr):
+            if e.expr_type == Expression.CALL:
+                callee = e.left
+                while callee.expr_type == Expression.GENERIC:
+                    callee = callee.left
+                if callee.expr_type != Expression.SIMPLE or not (
+                        callee.token.val in analysis.global_names or callee.token.val in free):
+                    return False
+        return True
+
+    def evaluate_global(self, name):
+        val = super().evaluate_global(name)
+        if name in self.pure_globals and callable(val):
+            self.pure_functions.add(id(val))
+        return val
+
+    def suspend(self, expr: Expression, env):
+        labels = self.suspendable.get(id(expr))
+        if labels is None:
+            return self.evaluate_expression(expr, env)
+
+        # when functions don't escape, a suspended local can never hold one, so it needn't be forced here
+        for label in labels:
+            v = env[label]
+            if callable(v) and id(v) not in self.pure_functions:
+                return self.evaluate_expression(expr, env)
+
+        return Thunk(lambda: self.evaluate_expression(expr, env))
+
+    def evaluate_expression_unsafe(self, expr: Expression, env):
+        if expr.expr_type == Expression.CONS:
+            head = self.evaluate_expression(expr.left, env)
+            tail = self.suspend(expr.right, env)
+            if isinstance(tail, (Thunk, LazyCons)):
+                self.allocate(1, expr.token)
+                return LazyCons(head, tail)
+            self.allocate(len(tail) + 1, expr.token)
+            return [head, *tail]
+
+        return super().evaluate_expression_unsafe(expr, env)
+
+    def evaluate_simple(self, token, env):
+        val = super().evaluate_simple(token, env)
+        if isinstance(val, Thunk):
+            return val.force()
+        return val
+
+    def evaluate_if(self, expr, env):
+        if expr.condition.expr_type == Expression.ARROW:
+            head, tail, lst_expr = expr.condition.left.left, expr.condition.left.right, expr.condition.right
+            lst = self.evaluate_expression(lst_expr, env)
+            if isinstance(lst, LazyCons):
+                subenv = {**env, head.token.val: lst.head, tail.token.val: lst.tail}
+                return self.evaluate_expression(expr.left, subenv)
+            elif len(lst) > 0:
+                subenv = {**env, head.token.val: lst[0], tail.token.val: list_tail(lst)}
+                return self.evaluate_expression(expr.left, subenv)
+            else:
+                return self.evaluate_expression(expr.right, env)
+
+        return super().evaluate_if(expr, env)
+
+    def evaluate_let(self, expr, env):
+        dest, source = expr.left.left, expr.left.right
+
+        if dest.expr_type == Expression.SIMPLE:
+            subenv = {**env, dest.token.val: self.suspend(source, env)}
+
+        elif dest.expr_type == Expression.TUPLE:
+            t = self.suspend(source, env)
+            subenv = {**env}
+            for i, label_expr in enumerate(dest.elements):
+                if isinstance(t, Thunk):
+                    subenv[label_expr.token.val] = Thunk(lambda i=i: t.force()[i])
+                else:
+                    subenv[label_expr.token.val] = t[i]
+
+        else:
+            raise ValueError
+
+        return self.evaluate_expression(expr.right, subenv)
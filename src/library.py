@@ -0,0 +1,98 @@
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Set
+
+from .ast import Declaration
+from .tokens import AzorError, LABEL_RE, Tokenizer, source_lines
+from .parser import Parser
+from .analysis import global_references, reachable
+
+# a line which starts a declaration begins with its label in the first column
+DECLARATION_START_RE = re.compile(LABEL_RE + r"\s*[{:(=]")
+WORD_RE = re.compile(r"[a-zA-Z_][a-zA-Z0-9_]*")
+
+
+class Library:
+    """
+    A library file whose declarations are kept as source text, and only tokenized and parsed when asked for.
+
+    The file is split into spans at lines which look like the start of a declaration. What a span refers to is
+    over-approximated by every word in it, which is enough to find everything a declaration could reach. If a
+    span doesn't parse to exactly the one declaration it was expected to hold, the split can't be trusted, and
+    the whole file is parsed instead.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, "r") as fh:
+            self.lines = list(source_lines(fh))
+
+        starts = [i for i, line in enumerate(self.lines) if DECLARATION_START_RE.match(line)]
+        self.labels: List[str] = [WORD_RE.match(self.lines[i]).group() for i in starts]
+        self.spans = dict(zip(self.labels, zip(starts, starts[1:] + [len(self.lines)])))
+        if len(self.spans) < len(self.labels):
+            # duplicates are an error which the typechecker reports, and it needs every declaration to do so
+            self.spans = None
+
+        self.references: Dict[str, Set[str]] = {}
+        for label, (start, end) in (self.spans or {}).items():
+            words = set(WORD_RE.findall("\n".join(self.lines[start:end])))
+            self.references[label] = (words & self.spans.keys()) - {label}
+
+    def declarations(self, labels: Set[str] = None) -> List[Declaration]:
+        """
+        Freshly parsed declarations with the given labels, or all of them, in the order they appear in the file.
+        If the file can't be split into declarations, all of them are returned.
+        """
+        if self.spans is not None and labels is not None:
+            stmts = [self.parse_span(label) for label in self.labels if label in labels]
+            if None not in stmts:
+                return stmts
+            self.spans = None
+
+        return Parser(Tokenizer(self.lines).iter_tokens()).parse()
+
+    def parse_span(self, label):
+        start, end = self.spans[label]
+        try:
+            stmts = Parser(Tokenizer(self.lines[start:end], start).iter_tokens()).parse()
+        except AzorError:
+            return None
+        if len(stmts) != 1 or stmts[0].label.val != label:
+            return None
+        return stmts[0]
+
+
+_libraries: Dict[tuple, Library] = {}
+_libraries_lock = threading.Lock()
+
+
+def load_library(filename: str) -> Library:
+    """A Library for filename, shared with every other caller until the file changes."""
+    key = (os.path.abspath(filename), os.path.getmtime(filename))
+    with _libraries_lock:
+        if key not in _libraries:
+            _libraries[key] = Library(filename)
+        return _libraries[key]
+
+
+def needed_declarations(stmts: List[Declaration], library: Library = None):
+    """
+    The labels of the declarations main can reach in a program made of library and stmts, or None if there is no
+    main and so everything is needed. Labels defined more than once are always needed, so that the typechecker
+    can report them.
+    """
+    labels = (library.labels if library is not None else []) + [stmt.label.val for stmt in stmts]
+    if "main" not in labels:
+        return None
+
+    names = set(labels)
+    references = dict(library.references) if library is not None else {}
+    for stmt in stmts:
+        label = stmt.label.val
+        references[label] = references.get(label, set()) | global_references(stmt.rhs, names)
+
+    duplicated = {label for label, count in Counter(labels).items() if count > 1}
+    return reachable(references, {"main"} | duplicated)
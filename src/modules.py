@@ -0,0 +1,236 @@
+import copy
+import hashlib
+import io
+import os
+import pickle
+from typing import Dict, List, Set
+
+from .ast import Declaration, Expression
+from .tokens import AzorError, Token
+from .typecheck import TypeChecker
+from .types import AzorType
+from .analysis import walk, global_references, reachable
+from .frontend import parse_streams
+from .library import Library
+from .stats import Stats
+
+MODULE_SUFFIX = ".azor"
+
+# compiled modules are cached in a directory of this name next to their source
+CACHE_DIR = "__azorcache__"
+
+# bump when the cached format, or anything pickled in it, changes
+CACHE_VERSION = 1
+
+# the dependency every module has on the stdlib it was checked against
+STDLIB_DEPENDENCY = "<stdlib>"
+
+
+def qualify(module: str, label: str) -> str:
+    return f"{module}.{label}"
+
+
+def is_qualified(label: str) -> bool:
+    """Whether label names a declaration from an imported module."""
+    return "." in label
+
+
+def is_exported(label: str) -> bool:
+    """Names starting with an underscore are private to their module."""
+    return not label.startswith("_")
+
+
+class Module:
+    """
+    A module compiled on its own. Its declarations are renamed to module.label, which is also how importers refer
+    to them, so every module has its own namespace and declarations from all modules can be run together.
+    """
+
+    def __init__(self, name: str, imports: List[Token], stmts: List[Declaration], types: Dict[str, AzorType],
+                 source_hash: str, dependency_hashes: Dict[str, str]):
+        self.name = name
+        self.imports = imports
+        self.stmts = stmts
+        # the types of every declaration, by qualified name
+        self.types = types
+        self.source_hash = source_hash
+        # the interface hash of each module this one was checked against, when it was checked
+        self.dependency_hashes = dependency_hashes
+        self.version = CACHE_VERSION
+
+    def interface(self) -> Dict[str, AzorType]:
+        """The types of the declarations other modules can use."""
+        return {label: t for label, t in self.types.items() if is_exported(label.split(".", 1)[1])}
+
+    def interface_hash(self) -> str:
+        """Changes exactly when the interface does, so that modules importing this one must be checked again."""
+        interface = self.interface()
+        return hashlib.sha256("\n".join(f"{label} : {interface[label]}" for label in sorted(interface)).encode()) \
+            .hexdigest()
+
+
+def source_hash(path: str) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+def cache_path(path: str, suffix: str = ".pickle") -> str:
+    """A file in the cache directory next to the source at path, named after the source."""
+    directory, filename = os.path.split(path)
+    if filename.endswith(MODULE_SUFFIX):
+        filename = filename[:-len(MODULE_SUFFIX)]
+    return os.path.join(directory, CACHE_DIR, filename + suffix)
+
+
+def read_pickle(filename: str):
+    """The value pickled in filename, or None if it can't be read."""
+    try:
+        with open(filename, "rb") as fh:
+            return pickle.load(fh)
+    except Exception:
+        # a missing, truncated or outdated cache file is just a cache miss
+        return None
+
+
+def write_pickle(filename: str, value):
+    """
+    Pickles value to filename, if its directory is writable. The file is replaced atomically, so readers never see
+    half of it.
+    """
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        temp = f"{filename}.{os.getpid()}.tmp"
+        with open(temp, "wb") as fh:
+            fh.write(data)
+        os.replace(temp, filename)
+    except (OSError, pickle.PicklingError, RecursionError):
+        pass
+
+
+def read_cache(path: str):
+    """The cached Module for the source at path, or None if there isn't a usable one."""
+    module = read_pickle(cache_path(path))
+    return module if getattr(module, "version", None) == CACHE_VERSION else None
+
+
+def write_cache(path: str, module: Module):
+    write_pickle(cache_path(path), module)
+
+
+def rename(stmts: List[Declaration], module: str):
+    """Renames the module's declarations, and its references to them, to their qualified names."""
+    own = {stmt.label.val for stmt in stmts}
+
+    def qualified(token: Token) -> Token:
+        token = copy.copy(token)
+        token.s = token.val = qualify(module, token.val)
+        return token
+
+    for stmt in stmts:
+        # locals can't shadow globals, so every label naming a declaration of the module refers to it
+        for e in walk(stmt.rhs):
+            if e.expr_type == Expression.SIMPLE and e.token.ttype == "LABEL" and e.token.val in own:
+                e.token = qualified(e.token)
+        stmt.label = stmt.token = qualified(stmt.label)
+
+
+class ModuleLoader:
+    """
+    Finds, compiles and caches the modules imported by a program, and the modules they import, all of which are
+    looked for in one directory. A cached module is used as long as its source is unchanged and the interfaces of
+    the modules it imports are too, so changing a module only rechecks it and the modules which use what changed.
+    When cache is False, every module is compiled from its source, and no cache is read or written.
+    """
+
+    def __init__(self, directory: str, library: Library = None, stats: Stats = None, cache=True):
+        self.directory = directory
+        self.cache = cache
+        self.library = library
+        self.stats = stats or Stats()
+        self.stdlib_hash = hashlib.sha256("\n".join(library.lines).encode()).hexdigest() if library else ""
+
+        # loaded modules, in an order where every module comes after the modules it imports
+        self.modules: Dict[str, Module] = {}
+        self.loading: List[str] = []
+
+    def load(self, name: Token) -> Module:
+        if name.val in self.modules:
+            return self.modules[name.val]
+        if name.val in self.loading:
+            name.raise_error("Import cycle: " + " -> ".join(self.loading[self.loading.index(name.val):] + [name.val]))
+
+        path = os.path.join(self.directory, name.val + MODULE_SUFFIX)
+        if not os.path.isfile(path):
+            name.raise_error(f"No module named {name.val} (looked for {path})")
+
+        self.loading.append(name.val)
+        try:
+            module = (self.cached(path) if self.cache else None) or self.compile(name.val, path)
+        finally:
+            self.loading.pop()
+
+        self.modules[name.val] = module
+        return module
+
+    def imported_types(self, imports: List[Token]) -> Dict[str, AzorType]:
+        """The types which code importing the given modules can use."""
+        types = {}
+        for name in imports:
+            types.update(self.load(name).interface())
+        return types
+
+    def dependency_hashes(self, imports: List[Token]) -> Dict[str, str]:
+        hashes = {name.val: self.load(name).interface_hash() for name in imports}
+        hashes[STDLIB_DEPENDENCY] = self.stdlib_hash
+        return hashes
+
+    def cached(self, path: str):
+        module = read_cache(path)
+        if module is None or module.source_hash != source_hash(path) \
+                or self.dependency_hashes(module.imports) != module.dependency_hashes:
+            return None
+        self.stats.count("modules_cached", 1)
+        return module
+
+    def compile(self, name: str, path: str) -> Module:
+        with open(path, "rb") as fh:
+            data = fh.read()
+        source = data.decode()
+        (stmts, imports), = parse_streams([io.StringIO(source)], [len(source)], self.stats)
+        imported = self.imported_types(imports)
+
+        stdlib_stmts, reserved = self.stdlib_for(stmts)
+        checker = TypeChecker(stdlib_stmts + stmts, reserved, imported)
+        try:
+            with self.stats.phase("typecheck"):
+                checker.check(require_main=False)
+        except AzorError as e:
+            raise AzorError(e.token, f"{e.message} (in module {name})") from e
+        self.stats.count("declarations_checked", checker.declarations_checked)
+
+        types = {qualify(name, stmt.label.val): checker.symbol_table[stmt.label.val] for stmt in stmts}
+        rename(stmts, name)
+        module = Module(name, imports, stmts, types, hashlib.sha256(data).hexdigest(),
+                        self.dependency_hashes(imports))
+        if self.cache:
+            write_cache(path, module)
+        self.stats.count("modules_compiled", 1)
+        return module
+
+    def stdlib_for(self, stmts: List[Declaration]):
+        """The stdlib declarations stmts can reach, parsed, and the labels of the rest."""
+        if self.library is None:
+            return [], set()
+
+        labels = {stmt.label.val for stmt in stmts}
+        names = set(self.library.labels) | labels
+        references = dict(self.library.references)
+        for stmt in stmts:
+            references[stmt.label.val] = references.get(stmt.label.val, set()) | global_references(stmt.rhs, names)
+
+        # stdlib names the module redeclares are included, so the typechecker reports them
+        needed: Set[str] = reachable(references, labels) - (labels - set(self.library.labels))
+        with self.stats.phase("parse"):
+            stdlib_stmts = self.library.declarations(needed)
+        return stdlib_stmts, set(self.library.labels) - {stmt.label.val for stmt in stdlib_stmts}
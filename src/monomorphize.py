@@ -0,0 +1,83 @@
+import copy
+from typing import Dict, List
+
+from .ast import Declaration, Expression
+from .analysis import walk
+from .typecheck import TypeChecker
+
+# the most specialized copies of generic functions made for one program
+DEFAULT_MAX_SPECIALIZATIONS = 256
+
+
+class Monomorphizer:
+    """
+    Makes a copy of each generic function for each type it is used at, named after the instantiation, like
+    map{INT, BOOL}, and points every use at its copy. Copies are specialized in turn, so the generic functions
+    they call are specialized too. Once max_specializations copies exist, further instantiations are left
+    generic, which is always correct, since the interpreter erases generic types anyway.
+
+    Runs on a typechecked program, and rewrites its expressions in place.
+    """
+
+    def __init__(self, stmts: List[Declaration], checker: TypeChecker,
+                 max_specializations=DEFAULT_MAX_SPECIALIZATIONS):
+        self.stmts = stmts
+        self.stmts_by_label = {stmt.label.val: stmt for stmt in stmts}
+        self.checker = checker
+        self.max_specializations = max_specializations
+
+        # the label of each copy, and the label of the generic declaration it was made from
+        self.specializations: Dict[str, str] = {}
+        self.clones: List[Declaration] = []
+        self.pending = []
+
+    def run(self) -> List[Declaration]:
+        """The program's declarations, followed by the specialized copies."""
+        for stmt in self.stmts:
+            if not getattr(self.checker.symbol_table[stmt.label.val], "generics", None):
+                self.rewrite(stmt.rhs, {}, [])
+
+        while self.pending:
+            clone, spec, generics = self.pending.pop()
+            self.rewrite(clone.rhs, spec, generics)
+
+        return self.stmts + self.clones
+
+    def rewrite(self, expr: Expression, spec, generics):
+        for e in walk(expr):
+            if e.expr_type == Expression.GENERIC:
+                self.specialize(e, spec, generics)
+
+    def specialize(self, expr: Expression, spec, generics):
+        callee = expr.left
+        if callee.expr_type != Expression.SIMPLE or callee.token.val not in self.stmts_by_label:
+            return
+        origin = self.stmts_by_label[callee.token.val]
+        ftype = self.checker.symbol_table[origin.label.val]
+
+        types = [
+            self.checker.eval_type(node, allowed_generics=set(generics)).resolve_generics(spec)
+            for node in expr.elements
+        ]
+        label = f"{origin.label.val}{{{', '.join(str(t) for t in types)}}}"
+
+        if label not in self.specializations:
+            if len(self.specializations) >= self.max_specializations:
+                return
+
+            clone_spec = dict(zip(ftype.generics, types))
+            token = copy.copy(origin.label)
+            token.s = token.val = label
+            clone = Declaration(token, origin.typehint, copy.deepcopy(origin.rhs))
+
+            self.checker.symbol_table[label] = ftype.resolve_generics(clone_spec)
+            self.specializations[label] = origin.label.val
+            self.clones.append(clone)
+            self.pending.append((clone, clone_spec, ftype.generics))
+
+        reference = copy.copy(callee.token)
+        reference.s = reference.val = label
+        expr.expr_type = Expression.SIMPLE
+        expr.token = reference
+        expr.left = None
+        expr.elements = None
@@ -0,0 +1,308 @@
+import copy
+import io
+import math
+import os
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+from .ast import Declaration, Expression
+from .analysis import ProgramAnalysis, walk
+from .evaluate import Interpreter
+from .governor import CLOCK_INTERVAL
+
+# Subtrees estimated to evaluate fewer nodes than this are never worth the cost of shipping to
+# another process, and a fork point whose subtrees evaluated fewer steps than this last time isn't forked.
+DEFAULT_MIN_COST = 1000
+
+
+def independent_children(expr: Expression) -> List[Expression]:
+    if expr.expr_type == Expression.CALL:
+        return expr.args.elements
+    elif expr.expr_type in (Expression.TUPLE, Expression.LIST):
+        return expr.elements
+    elif expr.expr_type == Expression.BINOP:
+        return [expr.left, expr.right]
+    else:
+        return []
+
+
+def all_nodes(stmts: List[Declaration]) -> List[Expression]:
+    """Every expression in the program, in an order which is the same in every process."""
+    return [e for stmt in stmts for e in walk(stmt.rhs)]
+
+
+class _ValuePickler(pickle.Pickler):
+    # Azor has no anonymous functions, so every function value is a global and can be sent by name
+    def __init__(self, file, names):
+        super().__init__(file)
+        self.names = names
+
+    def persistent_id(self, obj):
+        if callable(obj):
+            return self.names[id(obj)]
+        return None
+
+
+class _ValueUnpickler(pickle.Unpickler):
+    def __init__(self, file, interpreter: Interpreter):
+        super().__init__(file)
+        self.interpreter = interpreter
+
+    def persistent_load(self, name):
+        return self.interpreter.evaluate_global(name)
+
+
+def dumps(value, interpreter: Interpreter) -> bytes:
+    names = {id(v): k for k, v in list(interpreter.symbol_table.items()) if callable(v)}
+    buf = io.BytesIO()
+    _ValuePickler(buf, names).dump(value)
+    return buf.getvalue()
+
+
+def loads(data: bytes, interpreter: Interpreter):
+    return _ValueUnpickler(io.BytesIO(data), interpreter).load()
+
+
+_worker_interpreter = None
+_worker_nodes = None
+
+
+def _init_worker(stmts, natives, arithmetic, limits):
+    global _worker_interpreter, _worker_nodes
+    _worker_interpreter = Interpreter(stmts, natives, arithmetic, limits)
+    _worker_nodes = all_nodes(stmts)
+
+
+def _evaluate_in_worker(index, payload, budgets):
+    """
+    Evaluates a node within budgets, which are the deadline and the steps, depth and cells the caller has left.
+    Returns the pickled value, with the steps and cells it used and the depth it reached, for the caller to count.
+    """
+    interpreter = _worker_interpreter
+    interpreter.deadline, interpreter.max_steps, interpreter.max_depth, interpreter.max_cells = budgets
+    interpreter.steps = interpreter.cells = interpreter.depth = interpreter.peak_depth = 0
+    interpreter.next_check = interpreter.max_steps + 1
+    if interpreter.deadline is not None:
+        interpreter.next_check = min(interpreter.next_check, CLOCK_INTERVAL)
+
+    env = loads(payload, interpreter)
+    value = interpreter.evaluate_expression(_worker_nodes[index], env)
+    return dumps(value, interpreter), interpreter.steps, interpreter.cells, interpreter.peak_depth
+
+
+class _Task(threading.Thread):
+    def __init__(self, fn, *args):
+        super().__init__(daemon=True)
+        self.fn = fn
+        self.args = args
+        self.value = None
+        self.error = None
+        self.start()
+
+    def run(self):
+        try:
+            self.value = self.fn(*self.args)
+        except BaseException as e:
+            self.error = e
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class _Evaluating(threading.local):
+    # the interpreter, or fork of one, evaluating in each thread
+    interpreter = None
+
+
+class ParallelInterpreter(Interpreter):
+    """
+    Evaluates expensive, pure, independent subexpressions (the arguments of a call, the elements of a
+    tuple or list, or the operands of a binary operator) concurrently.
+
+    Fork points are found statically. At runtime, the first max_fork_depth - 1 levels of forking happen
+    on threads within this process, which do little but fan out further; at the last level each
+    subexpression is shipped to a worker process, which evaluates it sequentially.
+
+    Each forked subexpression is evaluated by a fork: a copy of the interpreter with counters of its own, which
+    are added to its parent's once it is done, as a worker's are. Functions and natives are shared by every fork,
+    so they evaluate on whichever fork is evaluating in the thread calling them.
+    """
+
+    def __init__(self, stmts: List[Declaration], natives=None, arithmetic=None, limits=None, workers=None,
+                 min_cost=DEFAULT_MIN_COST, fork_depth=None):
+        self.local = _Evaluating()
+        self.local.interpreter = self
+        super().__init__(stmts, natives, arithmetic, limits)
+        self.stmts = stmts
+        # workers charge for natives themselves, and the charged wrappers can't be pickled to them
+        self.worker_natives = natives
+        self.workers = workers or os.cpu_count() or 1
+        if fork_depth is None:
+            fork_depth = math.ceil(math.log2(self.workers)) + 1
+        self.max_fork_depth = fork_depth
+        self.fork_depth = 0
+        self.min_cost = min_cost
+        # the steps each fork point's forked subexpressions took last time, on average
+        self.costs = {}
+
+        self.pool = None
+
+        analysis = ProgramAnalysis(stmts)
+        self.node_index = {}
+        for i, e in enumerate(all_nodes(stmts)):
+            self.node_index.setdefault(id(e), i)
+
+        self.forks = {}
+        self.free_labels = {}
+        for stmt in stmts:
+            for e in walk(stmt.rhs):
+                forked = [
+                    i for i, child in enumerate(independent_children(e))
+                    if analysis.cost(child) >= min_cost and analysis.is_pure(child)
+                ]
+                if len(forked) >= 2:
+                    self.forks[id(e)] = forked
+                    for i in forked:
+                        child = independent_children(e)[i]
+                        self.free_labels[id(child)] = {
+                            n.token.val for n in walk(child)
+                            if n.expr_type == Expression.SIMPLE and n.token.ttype == "LABEL"
+                        }
+
+    def main(self, args):
+        if self.forks:
+            self.pool = ProcessPoolExecutor(
+                self.workers, initializer=_init_worker,
+                initargs=(self.stmts, self.worker_natives, self.arithmetic, self.limits))
+        try:
+            return super().main(args)
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown()
+
+    def evaluate_global(self, name):
+        if name not in self.symbol_table:
+            stmt = self.stmts_by_label[name]
+            if stmt.typehint.argnames is not None:
+                local = self.local
+
+                def val(*args):
+                    env = dict(zip(stmt.typehint.argnames, args))
+                    return local.interpreter.evaluate_expression(stmt.rhs, env)
+
+                self.symbol_table[name] = val
+        return super().evaluate_global(name)
+
+    def charged(self, fn, token):
+        local = self.local
+
+        def native(*args):
+            return local.interpreter.charge(fn(*args), token)
+        return native
+
+    def evaluate_expression_unsafe(self, expr: Expression, env):
+        forked = self.forks.get(id(expr))
+        if forked is not None and self.fork_depth < self.max_fork_depth:
+            if self.costs.get(id(expr), math.inf) >= self.min_cost:
+                return self.evaluate_forked(expr, env, forked)
+            return self.evaluate_measured(expr, env, forked)
+
+        return super().evaluate_expression_unsafe(expr, env)
+
+    def evaluate_forked(self, expr: Expression, env, forked):
+        exprs = independent_children(expr)
+        steps, cells = self.steps, self.cells
+        forks = {i: self.fork() for i in forked}
+
+        # above the last level, the first forked subexpression is evaluated on this thread
+        local = {forked[0]} if self.fork_depth + 1 < self.max_fork_depth else set()
+        tasks = {i: _Task(self.evaluate_in_fork, forks[i], exprs[i], env) for i in forked if i not in local}
+
+        values = []
+        for i, e in enumerate(exprs):
+            if i in tasks:
+                values.append(None)
+            elif i in local:
+                values.append(self.evaluate_in_fork(forks[i], e, env))
+            else:
+                values.append(self.evaluate_expression(e, env))
+
+        for i, task in tasks.items():
+            values[i] = task.result()
+
+        for fork in forks.values():
+            self.merge(fork.steps - steps, fork.cells - cells, fork.peak_depth, expr.token)
+        self.costs[id(expr)] = sum(fork.steps - steps for fork in forks.values()) / len(forked)
+        return self.combine(expr, env, values)
+
+    def evaluate_measured(self, expr: Expression, env, forked):
+        """Evaluates a fork point without forking, counting the steps its forked subexpressions take."""
+        values = []
+        spent = 0
+        for i, e in enumerate(independent_children(expr)):
+            steps = self.steps
+            values.append(self.evaluate_expression(e, env))
+            if i in forked:
+                spent += self.steps - steps
+        self.costs[id(expr)] = spent / len(forked)
+        return self.combine(expr, env, values)
+
+    def combine(self, expr: Expression, env, values):
+        """The value of a fork point, given the values of its independent children."""
+        if expr.expr_type == Expression.CALL:
+            return self.call(self.evaluate_expression(expr.left, env), values, expr.token)
+        elif expr.expr_type == Expression.TUPLE:
+            return tuple(values)
+        elif expr.expr_type == Expression.LIST:
+            self.allocate(len(values), expr.token)
+            return values
+        elif expr.expr_type == Expression.BINOP:
+            try:
+                return self.binops[expr.token.val](*values)
+            except ArithmeticError as e:
+                expr.token.raise_error(str(e))
+        else:
+            raise ValueError(f"Cannot fork expression of type {expr.expr_type}")
+
+    def fork(self):
+        """A copy of this interpreter to evaluate a forked subexpression with, one level of forking deeper."""
+        fork = copy.copy(self)
+        fork.fork_depth += 1
+        return fork
+
+    def evaluate_in_fork(self, fork, expr: Expression, env):
+        """Evaluates expr on fork, which ships it to a worker if it is at the last level of forking."""
+        local = self.local
+        previous = local.interpreter
+        local.interpreter = fork
+        try:
+            if fork.fork_depth == self.max_fork_depth:
+                return fork.evaluate_remotely(expr, env)
+            return fork.evaluate_expression(expr, env)
+        finally:
+            local.interpreter = previous
+
+    def merge(self, steps, cells, peak_depth, token):
+        """Counts the steps and cells a fork or worker used, and the depth it reached."""
+        self.steps += steps
+        if self.steps > self.max_steps:
+            self.check_budgets(token)
+        self.allocate(cells, token)
+        self.peak_depth = max(self.peak_depth, peak_depth)
+
+    def evaluate_remotely(self, expr: Expression, env):
+        labels = self.free_labels[id(expr)]
+        payload = dumps({k: v for k, v in env.items() if k in labels}, self)
+        # time.monotonic is the same clock in every process on a machine, so the deadline can be passed as it is.
+        # Concurrent tasks each get everything that's left, and the totals are checked as their counts come back.
+        budgets = (self.deadline, self.max_steps - self.steps, self.max_depth - self.depth,
+                   self.max_cells - self.cells)
+        future = self.pool.submit(_evaluate_in_worker, self.node_index[id(expr)], payload, budgets)
+        data, steps, cells, depth = future.result()
+        self.merge(steps, cells, self.depth + depth, expr.token)
+        return loads(data, self)
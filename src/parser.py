@@ -1,4 +1,4 @@
-from .tokens import Tokenizer, BINOP_PRECS
+from .tokens import Tokenizer, BINOP_PRECS, source_lines
 from .ast import Expression, TypeNode, Declaration
 
 
@@ -20,46 +20,75 @@ class Parser:
 
     @classmethod
     def parse_file(cls, filename):
+        return list(cls.stream_file(filename))
+
+    @classmethod
+    def stream_file(cls, filename):
+        """Yields the declarations in a file one at a time, reading only as much of it as each one needs."""
         with open(filename, "r") as fh:
-            code = fh.read().replace('\t', '    ')
+            yield from cls(Tokenizer(source_lines(fh)).iter_tokens()).declarations()
 
-        lines = code.split("\n")
-        tokens = Tokenizer(lines).tokenize()
-        return cls(tokens).parse()
+    @classmethod
+    def parse_source(cls, code):
+        lines = code.replace('\t', '    ').split("\n")
+        return cls(Tokenizer(lines).iter_tokens()).parse()
 
     def __init__(self, tokens):
-        self.tokens = tokens
-        self.i = 0
-        self.lhs = False
+        """tokens can be any iterable, and are consumed one at a time."""
+        self.tokens = iter(tokens)
+        self.current = None
+        self.last = None
+        self.tokens_read = 0
+        # the module name tokens of the imports read so far
+        self.imports = []
+        self.advance()
 
     def parse(self):
-        self.i = 0
-        self.lhs = False
-        stmts = []
-        while self.i < len(self.tokens):
-            stmts.append(self.grab_declaration())
+        return list(self.declarations())
 
-        return stmts
+    def declarations(self):
+        """Yields each declaration as it is parsed. Imports are collected in self.imports."""
+        while not self.eof():
+            if self.next().ttype == "IMPORT":
+                self.grab_import()
+            else:
+                yield self.grab_declaration()
+
+    def advance(self):
+        if self.current is not None:
+            self.last = self.current
+            self.tokens_read += 1
+        self.current = next(self.tokens, None)
 
     def next(self):
-        if self.i >= len(self.tokens):
-            self.tokens[-1].raise_error("Unexpected EOF")
-        return self.tokens[self.i]
+        if self.current is None:
+            self.last.raise_error("Unexpected EOF")
+        return self.current
 
     def eof(self):
-        return self.i == len(self.tokens)
+        return self.current is None
 
     def expect(self, ttype):
         if self.next().ttype != ttype:
             self.next().raise_error("Expected " + ttype)
-        self.i += 1
+        self.advance()
+
+    def grab_import(self):
+        self.expect("IMPORT")
+        name = self.next()
+        self.expect("LABEL")
+        if "." in name.val:
+            name.raise_error("Module names can't be qualified")
+        self.imports.append(name)
 
     def grab_declaration(self):
         label = self.next()
         self.expect("LABEL")
+        if "." in label.val:
+            label.raise_error("Declared names can't be qualified")
 
         if self.next().ttype == "{":
-            self.i += 1
+            self.advance()
             generics, _ = self.grab_series(lambda: self.grab_expr(-1))
             self.expect("}")
             for g in generics:
@@ -70,7 +99,7 @@ class Parser:
             generics = []
 
         if self.next().ttype == ':':
-            self.i += 1
+            self.advance()
             typehint = self.grab_type_node(vbl_names=True)
 
         elif self.next().ttype == '(':
@@ -103,9 +132,9 @@ class Parser:
                 simpletype=self.next().val,
                 token=t,
             )
-            self.i += 1
+            self.advance()
         elif t.ttype == "(":
-            self.i += 1
+            self.advance()
             constituents, _ = self.grab_series(self.grab_type_node)
             out = TypeNode(
                 ttype=TypeNode.TUPLE,
@@ -114,7 +143,7 @@ class Parser:
             )
             self.expect(")")
         elif t.ttype == "[":
-            self.i += 1
+            self.advance()
             out = TypeNode(
                 ttype=TypeNode.LIST,
                 etype=self.grab_type_node(),
@@ -122,7 +151,7 @@ class Parser:
             )
             self.expect("]")
         elif t.ttype == "LABEL":
-            self.i += 1
+            self.advance()
             out = TypeNode(
                 ttype=TypeNode.GENERIC,
                 label=t,
@@ -153,7 +182,7 @@ class Parser:
             argtypes.append(self.grab_type_node())
 
             if self.next().ttype == ",":
-                self.i += 1
+                self.advance()
             else:
                 break
 
@@ -164,7 +193,7 @@ class Parser:
     def grab_expr(self, suffix_precedence):
         if self.next().ttype in {"LABEL", "BOOL", "INT", "STRING", "CHAR"}:
             n = Expression(self.next(), Expression.SIMPLE)
-            self.i += 1
+            self.advance()
 
         elif self.next().ttype == '[':
             n = self.grab_list()
@@ -176,7 +205,7 @@ class Parser:
 
         elif self.next().s in '!-':
             t = self.next()
-            self.i += 1
+            self.advance()
             n = Expression(t, Expression.PREFIX)
             n.right = self.grab_expr(10)
 
@@ -288,14 +317,14 @@ class Parser:
 
         if t.ttype == "~" and precedence < Parser.get_prec(t):
             cons = Expression(n.token, Expression.CONS)
-            self.i += 1
+            self.advance()
             cons.left = n
             cons.right = self.grab_expr(Parser.get_prec(t))
             return self.check_suffixes(cons, precedence)
 
         if t.ttype in ["BINOP", *Parser.SUFFIX_PRECS.keys()]:
             binop = Expression(t, Expression.BINOP)
-            self.i += 1
+            self.advance()
             binop.left = n
             binop.right = self.grab_expr(Parser.get_prec(t))
             return self.check_suffixes(binop, precedence)
@@ -308,7 +337,7 @@ class Parser:
         while self.next().ttype not in "])}":
             elems.append(grabber())
             if self.next().ttype == ",":
-                self.i += 1
+                self.advance()
             else:
                 ended_with_comma = False
                 break
@@ -0,0 +1,139 @@
+from typing import Dict, List, Set
+
+from .ast import Declaration, Expression
+from .tokens import Token
+from .analysis import ProgramAnalysis, walk, callee_name, strongly_connected_components
+from .program import Program
+
+QUADRATIC = "O(n^2)"
+# for concatenations of k lists with n elements in total
+NESTED = "O(k*n)"
+
+CONCAT_FUNCTIONS = {"concat", "append"}
+
+
+class Finding:
+    def __init__(self, token: Token, label: str, message: str, complexity: str):
+        self.token = token
+        self.label = label
+        self.message = message
+        self.complexity = complexity
+
+    def key(self):
+        return self.token.line_no, self.token.col_no, self.message
+
+    def describe(self):
+        return f"{self.token.line_no + 1}:{self.token.col_no + 1}: {self.label}: {self.message} [{self.complexity}]"
+
+
+class PerformanceLinter:
+    """
+    Finds idioms which are accidentally quadratic under the current runtime, in a typechecked program:
+
+    - concatenating onto the result of a recursive call, as in reverse, which copies the partial result once per
+      level of the recursion;
+    - passing an accumulator to a recursive call with something appended to it, which copies the accumulator once
+      per call;
+    - testing the length of a list in the condition of a recursive function, when len isn't native and so walks
+      the whole list every time;
+    - left-nested concatenation, concat(concat(a, b), c), which copies a once per concatenation.
+
+    Recursion is found from the call graph, so functions which are mutually recursive count as recursive too.
+    natives are the labels bound to native implementations, which changes which of these are quadratic: native
+    len takes constant time, but native concat copies both of its arguments.
+    """
+
+    def __init__(self, stmts: List[Declaration], specializations: Dict[str, str] = None, natives=()):
+        self.analysis = ProgramAnalysis(stmts)
+        self.specializations = specializations or {}
+        self.natives = {self.origin(label) for label in natives}
+
+        # the declarations each declaration can be called back by, if it is recursive at all
+        self.cycles: Dict[str, Set[str]] = {}
+        for component in strongly_connected_components(self.analysis.references):
+            label = component[0]
+            if len(component) > 1 or label in self.analysis.references[label]:
+                for member in component:
+                    self.cycles[member] = set(component)
+
+    def origin(self, label):
+        return self.specializations.get(label, label)
+
+    def called(self, expr: Expression):
+        """The (unspecialized) name of the global a CALL invokes, or None."""
+        name = callee_name(expr, self.analysis.global_names)
+        return None if name is None else self.origin(name)
+
+    def lint(self, labels) -> List[Finding]:
+        """Findings in the declarations with the given labels, in source order, each reported once."""
+        findings = {}
+        for label in labels:
+            for finding in self.lint_declaration(self.analysis.stmts_by_label[label]):
+                findings.setdefault(finding.key(), finding)
+        return sorted(findings.values(), key=Finding.key)
+
+    def lint_declaration(self, stmt: Declaration) -> List[Finding]:
+        label = self.origin(stmt.label.val)
+        cycle = self.cycles.get(stmt.label.val, set())
+        findings = []
+
+        def recurses(expr: Expression):
+            return any(e.expr_type == Expression.CALL and callee_name(e, self.analysis.global_names) in cycle
+                       for e in walk(expr))
+
+        inner_concats = set()
+        for e in walk(stmt.rhs):
+            if e.expr_type != Expression.CALL:
+                continue
+            name = self.called(e)
+
+            if name in CONCAT_FUNCTIONS:
+                args = e.args.elements
+                # the Azor concat copies its first argument, and the native one copies both
+                copied = args if name in self.natives else args[:1]
+                if cycle and any(recurses(arg) for arg in copied):
+                    findings.append(Finding(e.token, label, f"{name} copies the result of a recursive call at "
+                                                            f"every level of the recursion", QUADRATIC))
+
+                if args and args[0].expr_type == Expression.CALL and self.called(args[0]) in CONCAT_FUNCTIONS:
+                    inner_concats.add(id(args[0]))
+                    if id(e) not in inner_concats:
+                        findings.append(Finding(e.token, label, f"left-nested {name} copies the first list "
+                                                                f"once per concatenation; nest to the right",
+                                                NESTED))
+
+            elif callee_name(e, self.analysis.global_names) in cycle:
+                for arg in e.args.elements:
+                    for a in walk(arg):
+                        if a.expr_type == Expression.CALL and self.called(a) in CONCAT_FUNCTIONS \
+                                and self.is_local(a.args.elements[0]):
+                            findings.append(Finding(a.token, label, f"{self.called(a)} onto an accumulator "
+                                                                    f"passed to a recursive call copies it on "
+                                                                    f"every call", QUADRATIC))
+
+        if cycle and "len" not in self.natives:
+            for e in walk(stmt.rhs):
+                if e.expr_type != Expression.IF:
+                    continue
+                for c in walk(e.condition):
+                    if c.expr_type == Expression.CALL and self.called(c) == "len":
+                        findings.append(Finding(c.token, label, "len walks the whole list on every recursive "
+                                                                "call; match on h ~ t <- l instead", QUADRATIC))
+
+        return findings
+
+    def is_local(self, expr: Expression):
+        return expr.expr_type == Expression.SIMPLE and expr.token.ttype == "LABEL" \
+            and expr.token.val not in self.analysis.global_names
+
+
+def lint_program(program: Program, native=True) -> List[Finding]:
+    """
+    Findings in every declaration of program outside the stdlib, judged as if run with or without natives. The
+    program should be compiled with cse=False, since hoisting repeated calls into lets hides some of the idioms.
+    """
+    natives = program.natives() if native else ()
+    linter = PerformanceLinter(program.stmts, program.specializations, natives)
+    stdlib_labels = set(program.stdlib_labels)
+    return linter.lint([stmt.label.val for stmt in program.stmts
+                        if program.specializations.get(stmt.label.val, stmt.label.val) not in stdlib_labels])
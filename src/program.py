@@ -0,0 +1,254 @@
+import io
+import os
+import threading
+from typing import Dict, List, Set
+
+from .ast import Declaration
+from .typecheck import TypeChecker
+from .types import AzorType
+from .analysis import ProgramAnalysis, unboxable_lets, loopable_conses
+from .fusion import fusible_calls
+from .frontend import parse_streams
+from .library import load_library, needed_declarations
+from .modules import ModuleLoader
+from .monomorphize import Monomorphizer, DEFAULT_MAX_SPECIALIZATIONS
+from .cse import CommonSubexpressions
+from .constcache import ConstantCache, closure_hashes
+from .arith import Arithmetic, BIGINT
+from .evaluate import Interpreter, ListView, native_bindings
+from .aio import AsyncInterpreter, DEFAULT_YIELD_INTERVAL
+from .stats import Stats
+
+STDLIB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "azor", "stdlib.azor")
+
+
+def contains_function(value):
+    if callable(value):
+        return True
+    elif isinstance(value, (list, tuple, ListView)):
+        return any(contains_function(v) for v in value)
+    return False
+
+
+def arithmetic_settings(arithmetic: Arithmetic = None) -> tuple:
+    """The settings of arithmetic which can change the value of a constant."""
+    return (BIGINT, None) if arithmetic is None else (arithmetic.mode, arithmetic.max_pow_bits)
+
+
+class Program:
+    """
+    A parsed and typechecked Azor program. Programs are never modified by running them, so a single Program can
+    be run any number of times, from any number of threads at once.
+
+    The values of constant globals which can't reach a side effect are the same in every run, so once one run has
+    computed them, later runs start with them already evaluated. Programs compiled from a file also save those
+    values to a cache next to it, so later processes running the program start with them too.
+    """
+
+    def __init__(self, stmts: List[Declaration], stdlib_labels: List[str], types: Dict[str, AzorType],
+                 specializations: Dict[str, str] = None, cache: ConstantCache = None):
+        self.stmts = stmts
+        self.stdlib_labels = stdlib_labels
+        self.types = types
+        # specialized copies of generic functions, and the declarations they were copied from
+        self.specializations = specializations or {}
+        self.unboxed_lets = unboxable_lets(stmts)
+        self.looped_conses = loopable_conses(stmts)
+        self.fused_calls = fusible_calls(stmts)
+
+        # A constant has no arguments, so any function it calls is one it reaches by name. If none of those can
+        # reach a side effect, then neither can it.
+        analysis = ProgramAnalysis(stmts)
+        self.shareable = {
+            label for label, stmt in analysis.stmts_by_label.items()
+            if stmt.typehint.argnames is None and label not in analysis.effectful
+        }
+
+        self.lock = threading.Lock()
+        # values of shareable constants by the arithmetic settings they were computed with, since the 64-bit modes
+        # and max_pow_bits can change them
+        self.constants: Dict[tuple, Dict[str, object]] = {}
+        self._natives = {}
+
+        self.cache = cache if self.shareable else None
+        self.closure_hashes: Dict[str, str] = {}
+        self.cache_loaded = False
+
+    def natives(self, arithmetic: Arithmetic = None):
+        mode = BIGINT if arithmetic is None else arithmetic.mode
+        with self.lock:
+            if mode not in self._natives:
+                natives = native_bindings(self.stdlib_labels, self.types, arithmetic)
+                for label, origin in self.specializations.items():
+                    if origin in natives:
+                        natives[label] = natives[origin]
+                self._natives[mode] = natives
+            return self._natives[mode]
+
+    def run(self, args=(), stdin=None, stdout=None, arithmetic: Arithmetic = None, limits=None, native=True) -> int:
+        """
+        Runs main with the given list of string arguments and returns its result. input and print read from stdin
+        and write to stdout, which default to the process's own. Errors in the program raise AzorError.
+        """
+        interpreter = Interpreter(
+            self.stmts,
+            natives=self.natives(arithmetic) if native else None,
+            arithmetic=arithmetic,
+            limits=limits,
+            stdin=stdin,
+            stdout=stdout,
+            unboxed_lets=self.unboxed_lets,
+            looped_conses=self.looped_conses,
+            fused_calls=self.fused_calls,
+        )
+
+        share = limits is None or not limits.counts_work()
+        if share:
+            interpreter.symbol_table.update(self.shared_constants(arithmetic))
+
+        try:
+            return interpreter.main(list(args))
+        finally:
+            if share:
+                self.save_constants(interpreter)
+
+    async def run_async(self, args=(), reader=None, writer=None, arithmetic: Arithmetic = None, limits=None,
+                        native=True, yield_interval=DEFAULT_YIELD_INTERVAL) -> int:
+        """
+        Runs main inside the running asyncio event loop, handing control back to it every yield_interval
+        evaluation steps. input and print use the given asyncio StreamReader and StreamWriter.
+        """
+        interpreter = AsyncInterpreter(
+            self.stmts,
+            reader=reader,
+            writer=writer,
+            natives=self.natives(arithmetic) if native else None,
+            arithmetic=arithmetic,
+            limits=limits,
+            yield_interval=yield_interval,
+        )
+
+        share = limits is None or not limits.counts_work()
+        if share:
+            interpreter.symbol_table.update(self.shared_constants(arithmetic))
+
+        try:
+            return await interpreter.main(list(args))
+        finally:
+            if share:
+                self.save_constants(interpreter)
+
+    def shared_constants(self, arithmetic: Arithmetic = None) -> Dict[str, object]:
+        """The constants already computed by earlier runs in the given arithmetic, here or in the cache."""
+        with self.lock:
+            if self.cache is not None and not self.cache_loaded:
+                self.load_cache()
+            return dict(self.constants.get(arithmetic_settings(arithmetic), {}))
+
+    def load_cache(self):
+        self.closure_hashes = closure_hashes(self.stmts, self.shareable)
+        labels = {closure_hash: label for label, closure_hash in self.closure_hashes.items()}
+        for (settings, closure_hash), value in self.cache.read().items():
+            if closure_hash in labels:
+                self.constants.setdefault(settings, {})[labels[closure_hash]] = value
+        self.cache_loaded = True
+
+    def save_constants(self, interpreter: Interpreter):
+        with self.lock:
+            known = self.constants.setdefault(arithmetic_settings(interpreter.arithmetic), {})
+            # function values are closures over the interpreter that created them, so they can't be shared
+            found = {
+                label: interpreter.symbol_table[label] for label in self.shareable
+                if label in interpreter.symbol_table and label not in known
+            }
+            found = {label: value for label, value in found.items() if not contains_function(value)}
+            known.update(found)
+
+            if found and self.cache_loaded:
+                # only this program's current constants are written, so values of edited ones don't pile up
+                self.cache.write({
+                    (settings, self.closure_hashes[label]): value
+                    for settings, values in self.constants.items() for label, value in values.items()
+                })
+
+
+def compile(source: str, stdlib=True, stats: Stats = None, workers=None, prune=True,
+            max_specializations=DEFAULT_MAX_SPECIALIZATIONS, directory=None, cse=True) -> Program:
+    """
+    Parses and typechecks Azor source code, raising AzorError if it is invalid. Timings and counts for each phase
+    are added to stats, if given. Large programs are tokenized with up to workers processes. Unless prune is
+    False, declarations which main can't reach are dropped without being typechecked, and stdlib declarations
+    are only parsed if they are reached. Generic functions get up to max_specializations copies specialized to
+    the types they are used at. Imported modules are looked for in directory, which defaults to the current one,
+    and are only cached there when directory is given. Unless cse is False, pure calls repeated within a
+    declaration are hoisted so they are only evaluated once.
+    """
+    return _compile(io.StringIO(source), len(source), stdlib, stats, workers, prune, max_specializations,
+                    directory or os.getcwd(), directory is not None, None, cse)
+
+
+def compile_file(filename: str, stdlib=True, stats: Stats = None, workers=None, prune=True,
+                 max_specializations=DEFAULT_MAX_SPECIALIZATIONS, cache_constants=True, cse=True) -> Program:
+    """
+    Like compile, for the source in filename. Unless cache_constants is False, the values of pure constants are
+    saved next to it once computed, and loaded rather than computed again by later runs.
+    """
+    cache = ConstantCache(filename) if cache_constants else None
+    with open(filename, "r") as fh:
+        return _compile(fh, os.path.getsize(filename), stdlib, stats, workers, prune, max_specializations,
+                        os.path.dirname(os.path.abspath(filename)), True, cache, cse)
+
+
+def _compile(stream, size, stdlib, stats: Stats, workers, prune, max_specializations, directory, cache_modules,
+             cache: ConstantCache, cse) -> Program:
+    stats = stats or Stats()
+    (stmts, imports), = parse_streams([stream], [size], stats, workers)
+    library = load_library(STDLIB_PATH) if stdlib else None
+    labels = (library.labels if library is not None else []) + [stmt.label.val for stmt in stmts]
+
+    # imported modules are checked, or loaded from their caches, first, and then linked in already checked
+    loader = ModuleLoader(directory, library, stats, cache_modules)
+    imported = loader.imported_types(imports)
+    linked = [stmt for module in loader.modules.values() for stmt in module.stmts]
+    linked_types = {label: t for module in loader.modules.values() for label, t in module.types.items()}
+
+    needed = needed_declarations(linked + stmts, library) if prune else None
+    if needed is not None:
+        stmts = [stmt for stmt in stmts if stmt.label.val in needed]
+        linked = [stmt for stmt in linked if stmt.label.val in needed]
+    with stats.phase("parse"):
+        stdlib_stmts = library.declarations(needed) if library is not None else []
+
+    checked = {stmt.label.val for stmt in stdlib_stmts + stmts}
+    stats.count("declarations_skipped", len(labels) - len(stdlib_stmts) - len(stmts))
+    return _check(stdlib_stmts, stmts, stats, set(labels) - checked, max_specializations, imported, linked,
+                  linked_types, cache, cse)
+
+
+def _check(stdlib_stmts: List[Declaration], stmts: List[Declaration], stats: Stats, reserved: Set[str],
+           max_specializations, imported: Dict[str, AzorType], linked: List[Declaration],
+           linked_types: Dict[str, AzorType], cache: ConstantCache, cse) -> Program:
+    checker = TypeChecker(stdlib_stmts + stmts, reserved, imported)
+    with stats.phase("typecheck"):
+        checker.check()
+    stats.count("declarations_checked", checker.declarations_checked)
+    stats.count("type_comparisons", checker.comparisons)
+
+    checker.symbol_table.update(linked_types)
+    stmts = stdlib_stmts + linked + stmts
+
+    monomorphizer = Monomorphizer(stmts, checker, max_specializations)
+    with stats.phase("monomorphize"):
+        stmts = monomorphizer.run()
+    stats.count("specializations", len(monomorphizer.specializations))
+
+    if cse:
+        with stats.phase("cse"):
+            hoisted = CommonSubexpressions(stmts).run()
+        stats.count("hoisted_subexpressions", hoisted)
+
+    with stats.phase("analyze"):
+        program = Program(stmts, [stmt.label.val for stmt in stdlib_stmts], checker.symbol_table,
+                          monomorphizer.specializations, cache)
+    stats.count("fused_calls", len(program.fused_calls))
+    return program
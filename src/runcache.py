@@ -0,0 +1,76 @@
+import hashlib
+import io
+import os
+from typing import List, Optional, Tuple
+
+from .ast import Declaration
+from .analysis import ProgramAnalysis
+from .constcache import closure_hashes
+from .modules import cache_path, read_pickle, write_pickle
+
+# bump when the cached format, or anything that goes into a key, changes
+RUN_CACHE_VERSION = 1
+
+
+def run_inputs(stmts: List[Declaration]) -> Tuple[bool, bool]:
+    """Whether main can reach rand, and whether it can reach input."""
+    reached = ProgramAnalysis(stmts).reachable({"main"})
+    return "rand" in reached, "input" in reached
+
+
+def run_key(stmts: List[Declaration], args: List[str], stdin: Optional[str], settings) -> str:
+    """
+    A hash of everything the output of a deterministic run depends on: the declarations main can reach, its
+    arguments, everything on stdin (None if the program never reads it), and settings, which are the arithmetic
+    and limits that can change whether a run succeeds and what it prints.
+    """
+    key = (
+        RUN_CACHE_VERSION,
+        closure_hashes(stmts, {"main"})["main"],
+        tuple(args),
+        None if stdin is None else hashlib.sha256(stdin.encode()).hexdigest(),
+        tuple(settings),
+    )
+    return hashlib.sha256(repr(key).encode()).hexdigest()
+
+
+class Tee(io.TextIOBase):
+    """A text stream which writes to stream, and keeps a copy of everything written."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.parts: List[str] = []
+
+    def write(self, s):
+        self.parts.append(s)
+        return self.stream.write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+    def getvalue(self) -> str:
+        return "".join(self.parts)
+
+
+class RunCache:
+    """
+    The exit codes and output of earlier runs of a program, saved in the cache directory next to its source, one
+    file per key. Only runs which can't reach rand should be cached, since their output is a function of the key.
+    """
+
+    def __init__(self, path: str):
+        self.directory = cache_path(path, ".runs")
+
+    def filename(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".pickle")
+
+    def get(self, key: str) -> Optional[Tuple[int, str]]:
+        """The exit code and output of the run with this key, or None if there isn't a usable one."""
+        saved = read_pickle(self.filename(key))
+        if not isinstance(saved, tuple) or len(saved) != 3 or saved[0] != RUN_CACHE_VERSION:
+            return None
+        return saved[1], saved[2]
+
+    def put(self, key: str, exit_code: int, output: str):
+        """Saves a run, if the directory is writable."""
+        write_pickle(self.filename(key), (RUN_CACHE_VERSION, exit_code, output))
@@ -0,0 +1,127 @@
+import threading
+from collections import Counter
+from typing import List
+
+from .ast import Declaration, Expression
+from .evaluate import Interpreter
+
+DEFAULT_SAMPLE_RATE = 100
+
+# the most frames a sample keeps, half from each end of the stack, so that deep mutual recursion can't make the
+# collapsed output huge
+MAX_SAMPLE_FRAMES = 200
+
+
+class SamplingInterpreter(Interpreter):
+    """
+    An interpreter which keeps a stack of the Azor functions currently being called, so that a SamplingProfiler
+    can look at it from another thread. Each frame is a function's name and the line it is declared on. A function
+    calling itself directly doesn't push another frame, so recursion over a list is a single frame however long
+    the list is.
+    """
+
+    def __init__(self, stmts: List[Declaration], natives=None, arithmetic=None, limits=None, unboxed_lets=None):
+        super().__init__(stmts, natives, arithmetic, limits, unboxed_lets=unboxed_lets)
+        self.stack = []
+        # one string per function, so that the top frame can be compared by identity
+        self.frames = {}
+        for name, value in list(self.symbol_table.items()):
+            self.symbol_table[name] = self.framed(name, value)
+
+    def frame(self, name):
+        if name not in self.frames:
+            stmt = self.stmts_by_label.get(name)
+            self.frames[name] = f"{name} (builtin)" if stmt is None else f"{name}:{stmt.label.line_no + 1}"
+        return self.frames[name]
+
+    def framed(self, name, fn):
+        frame = self.frame(name)
+        stack = self.stack
+
+        def call(*args):
+            if stack and stack[-1] is frame:
+                return fn(*args)
+            stack.append(frame)
+            try:
+                return fn(*args)
+            finally:
+                stack.pop()
+
+        return call
+
+    def evaluate_global(self, name):
+        if name not in self.symbol_table:
+            value = super().evaluate_global(name)
+            if callable(value):
+                self.symbol_table[name] = self.framed(name, value)
+        return self.symbol_table[name]
+
+    def enter(self, expr: Expression):
+        # the loops enter the functions they call without calling them, so their frames are pushed here, and
+        # popped when the loop returns
+        callee = expr.left
+        while callee.expr_type == Expression.GENERIC:
+            callee = callee.left
+        frame = self.frame(callee.token.val)
+        if not self.stack or self.stack[-1] is not frame:
+            self.stack.append(frame)
+
+    def evaluate_cons_loop(self, expr: Expression, env):
+        height = len(self.stack)
+        try:
+            return super().evaluate_cons_loop(expr, env)
+        finally:
+            del self.stack[height:]
+
+    def evaluate_unboxed(self, expr: Expression, env, labels, dest):
+        height = len(self.stack)
+        try:
+            return super().evaluate_unboxed(expr, env, labels, dest)
+        finally:
+            del self.stack[height:]
+
+
+class SamplingProfiler(threading.Thread):
+    """
+    Samples the call stack of a SamplingInterpreter rate times per second, counting how often each stack is seen.
+    write_collapsed writes the counts in the collapsed format read by flamegraph.pl, speedscope and similar tools.
+    """
+
+    def __init__(self, interpreter: SamplingInterpreter, rate=DEFAULT_SAMPLE_RATE):
+        super().__init__(daemon=True)
+        self.interpreter = interpreter
+        self.interval = 1 / rate
+        self.samples = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        stack = self.interpreter.stack
+        while not self.stopped.wait(self.interval):
+            # copying a slice of a list is atomic under the GIL, so this never sees a half-pushed frame
+            if len(stack) > MAX_SAMPLE_FRAMES:
+                half = MAX_SAMPLE_FRAMES // 2
+                frames = [*stack[:half], "...", *stack[-half:]]
+            else:
+                frames = stack[:]
+            if frames:
+                self.samples[';'.join(frames)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def write_collapsed(self, file):
+        for frames, count in sorted(self.samples.items()):
+            file.write(f"{frames} {count}\n")
+
+
+def profile(interpreter: SamplingInterpreter, args, filename, rate=DEFAULT_SAMPLE_RATE):
+    """Runs main under a SamplingProfiler, writing the collapsed stacks to filename even if the run fails."""
+    profiler = SamplingProfiler(interpreter, rate)
+    profiler.start()
+    try:
+        return interpreter.main(args)
+    finally:
+        profiler.stop()
+        with open(filename, "w") as f:
+            profiler.write_collapsed(f)
@@ -0,0 +1,37 @@
+import json
+import time
+from contextlib import contextmanager
+
+
+class Stats:
+    """
+    Timings and counters collected while compiling and running a program. Timings are wall-clock seconds per phase
+    and are added up if a phase runs more than once, as tokenize and parse do for the stdlib and the program.
+    """
+
+    def __init__(self):
+        self.timings = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + time.perf_counter() - start
+
+    def count(self, name, n):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def record_run(self, interpreter):
+        self.count("steps", interpreter.steps)
+        self.count("peak_depth", interpreter.peak_depth)
+        self.count("cells", interpreter.cells)
+
+    def as_dict(self):
+        return {"timings": self.timings, "counters": self.counters}
+
+    def write(self, file):
+        json.dump(self.as_dict(), file, indent=2)
+        file.write("\n")
@@ -0,0 +1,233 @@
+from typing import Callable, Dict, List
+
+from .ast import Declaration, Expression
+from .evaluate import Interpreter, SIDE_EFFECT_FUNCTIONS, list_tail
+
+# calls of a function after which it is compiled
+DEFAULT_TIER_THRESHOLD = 100
+
+
+class ClosureCompiler:
+    """
+    Compiles a declaration's body into nested Python closures, one per expression node, which take the local
+    environment and return the node's value. This skips the interpreter's dispatch on expression type and its
+    per-node bookkeeping. Steps are counted once per call of a compiled function rather than once per node.
+
+    Nodes which the interpreter evaluates as loops (list building in tail position, fused traversals and unboxed
+    lets) are handed back to it, so compiled code keeps the same stack depth and complexity.
+    """
+
+    def __init__(self, interpreter: Interpreter):
+        self.interpreter = interpreter
+
+    def is_global(self, name):
+        interp = self.interpreter
+        return name in interp.stmts_by_label or name in interp.natives or name in SIDE_EFFECT_FUNCTIONS
+
+    def compile_function(self, stmt: Declaration) -> Callable:
+        interp = self.interpreter
+        body = self.compile(stmt.rhs)
+        argnames = stmt.typehint.argnames
+        token = stmt.rhs.token
+
+        def fn(*args):
+            interp.steps += 1
+            if interp.steps >= interp.next_check:
+                interp.check_budgets(token)
+            try:
+                return body(dict(zip(argnames, args)))
+            except RecursionError:
+                token.raise_error("Maximum recursion depth exceeded evaluating this expression")
+
+        return fn
+
+    def compile(self, expr: Expression) -> Callable:
+        interp = self.interpreter
+        token = expr.token
+
+        if expr.expr_type == Expression.SIMPLE:
+            if token.ttype == "LABEL":
+                name = token.val
+                if not self.is_global(name):
+                    return lambda env: env[name]
+                symbol_table = interp.symbol_table
+
+                def lookup(env):
+                    if name in symbol_table:
+                        return symbol_table[name]
+                    return interp.evaluate_global(name)
+                return lookup
+
+            value = interp.evaluate_simple(token, {})
+            return lambda env: value
+
+        elif expr.expr_type == Expression.TUPLE:
+            elements = [self.compile(e) for e in expr.elements]
+            return lambda env: tuple([e(env) for e in elements])
+
+        elif expr.expr_type == Expression.LIST:
+            elements = [self.compile(e) for e in expr.elements]
+
+            def build_list(env):
+                interp.allocate(len(elements), token)
+                return [e(env) for e in elements]
+            return build_list
+
+        elif expr.expr_type == Expression.IF:
+            left, right = self.compile(expr.left), self.compile(expr.right)
+
+            if expr.condition.expr_type == Expression.ARROW:
+                head = expr.condition.left.left.token.val
+                tail = expr.condition.left.right.token.val
+                lst_fn = self.compile(expr.condition.right)
+
+                def unpack(env):
+                    lst = lst_fn(env)
+                    if len(lst) > 0:
+                        return left({**env, head: lst[0], tail: list_tail(lst)})
+                    return right(env)
+                return unpack
+
+            condition = self.compile(expr.condition)
+            return lambda env: left(env) if condition(env) else right(env)
+
+        elif expr.expr_type == Expression.BINOP:
+            left, right = self.compile(expr.left), self.compile(expr.right)
+            binop = interp.binops[token.val]
+
+            def apply(env):
+                a = left(env)
+                b = right(env)
+                try:
+                    return binop(a, b)
+                except ArithmeticError as e:
+                    token.raise_error(str(e))
+            return apply
+
+        elif expr.expr_type == Expression.CONS:
+            if id(expr) in interp.looped_conses:
+                return lambda env: interp.evaluate_cons_loop(expr, env)
+            left, right = self.compile(expr.left), self.compile(expr.right)
+
+            def cons(env):
+                lst = [left(env), *right(env)]
+                interp.allocate(len(lst), token)
+                return lst
+            return cons
+
+        elif expr.expr_type == Expression.LET:
+            dest, source = expr.left.left, expr.left.right
+            body = self.compile(expr.right)
+
+            if dest.expr_type == Expression.SIMPLE:
+                name = dest.token.val
+                source_fn = self.compile(source)
+                return lambda env: body({**env, name: source_fn(env)})
+
+            labels = [label_expr.token.val for label_expr in dest.elements]
+            if id(expr) in interp.unboxed_lets:
+                def unboxed(env):
+                    subenv = {**env}
+                    interp.evaluate_unboxed(source, env, labels, subenv)
+                    return body(subenv)
+                return unboxed
+
+            source_fn = self.compile(source)
+
+            def unpack_tuple(env):
+                subenv = {**env}
+                subenv.update(zip(labels, source_fn(env)))
+                return body(subenv)
+            return unpack_tuple
+
+        elif expr.expr_type == Expression.CALL:
+            if id(expr) in interp.fused_calls:
+                fused = interp.fused_calls[id(expr)]
+                return lambda env: interp.evaluate_fused(fused, env)
+
+            callee = self.compile(expr.left)
+            args = [self.compile(arg) for arg in expr.args.elements]
+            looped = id(expr) in interp.looped_conses
+
+            def call(env):
+                if looped and interp.called_declaration(expr, env) is not None:
+                    return interp.evaluate_cons_loop(expr, env)
+                f = callee(env)
+                values = [arg(env) for arg in args]
+                interp.depth += 1
+                try:
+                    if interp.depth > interp.peak_depth:
+                        if interp.depth > interp.max_depth:
+                            raise interp.depth_exceeded(token)
+                        interp.peak_depth = interp.depth
+                    return f(*values)
+                except EOFError:
+                    token.raise_error("Reached the end of the input")
+                finally:
+                    interp.depth -= 1
+            return call
+
+        elif expr.expr_type == Expression.GENERIC:
+            return self.compile(expr.left)
+
+        elif expr.expr_type == Expression.PREFIX:
+            right = self.compile(expr.right)
+            if token.ttype == '!':
+                return lambda env: not right(env)
+            negate = interp.negate
+
+            def negative(env):
+                try:
+                    return negate(right(env))
+                except ArithmeticError as e:
+                    token.raise_error(str(e))
+            return negative
+
+        raise ValueError(f"Cannot compile expression of type {expr.expr_type}")
+
+
+class TieredInterpreter(Interpreter):
+    """
+    An interpreter which starts every function in the tree walker, and compiles a function with ClosureCompiler
+    once it has been called threshold times. Code which runs rarely, like most of the stdlib, is never compiled,
+    while hot functions get the faster form. A compiled function replaces the original in the symbol table, and
+    the original forwards to it, for callers which captured it as a value before it was compiled.
+    """
+
+    def __init__(self, stmts: List[Declaration], natives=None, arithmetic=None, limits=None, unboxed_lets=None,
+                 fused_calls=None, threshold=DEFAULT_TIER_THRESHOLD):
+        super().__init__(stmts, natives, arithmetic, limits, unboxed_lets=unboxed_lets, fused_calls=fused_calls)
+        self.threshold = threshold
+        self.compiler = ClosureCompiler(self)
+        self.compiled: Dict[str, Callable] = {}
+
+    def evaluate_global(self, name):
+        if name in self.symbol_table:
+            return self.symbol_table[name]
+
+        stmt = self.stmts_by_label[name]
+        if stmt.typehint.argnames is None:
+            return super().evaluate_global(name)
+
+        calls = 0
+
+        def val(*args):
+            nonlocal calls
+            if name in self.compiled:
+                return self.compiled[name](*args)
+
+            calls += 1
+            if calls >= self.threshold:
+                return self.promote(name)(*args)
+
+            env = dict(zip(stmt.typehint.argnames, args))
+            return self.evaluate_expression(stmt.rhs, env)
+
+        self.symbol_table[name] = val
+        return val
+
+    def promote(self, name) -> Callable:
+        fn = self.compiler.compile_function(self.stmts_by_label[name])
+        self.compiled[name] = fn
+        self.symbol_table[name] = fn
+        return fn
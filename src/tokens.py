@@ -1,8 +1,9 @@
 import re
-import sys
 
 INT_RE = "(-?[1-9][0-9]*|0)"
 LABEL_RE = "([a-zA-Z_][a-zA-Z0-9_]*)"
+# a label qualified by the module it comes from, like geometry.area
+QUALIFIED_LABEL_RE = r"([a-zA-Z_][a-zA-Z0-9_]*(?:\.[a-zA-Z_][a-zA-Z0-9_]*)?)"
 
 BINOP_PRECS = {
     '+': 2,
@@ -47,72 +48,75 @@ PUNCT = {
 ALL_PUNCTUATION = set(BINOP_PRECS.keys()) | COMPARISONS | LOGIC | PUNCT
 
 
+class AzorError(Exception):
+    """An error in an Azor program, located at a token."""
+
+    def __init__(self, token, message):
+        super().__init__(token, message)
+        self.token = token
+        self.message = message
+
+    def __str__(self):
+        s = self.token.line + "\n"
+        s += ' '*self.token.col_no + '^' + "\n"
+        s += f"(line {self.token.line_no + 1}, column {self.token.col_no + 1}) " + self.message
+        return s
+
+
+# the (ttype, val) of every token whose text is fixed
+FIXED_TOKENS = {
+    "INT": ("TYPE", int),
+    "BOOL": ("TYPE", bool),
+    "if": ("IF", None),
+    "then": ("THEN", None),
+    "else": ("ELSE", None),
+    "import": ("IMPORT", None),
+    "let": ("LET", None),
+    "in": ("IN", None),
+    "of": ("OF", None),
+    "true": ("BOOL", True),
+    "false": ("BOOL", False),
+    **{s: ("BINOP", s) for s in BINOP_PRECS},
+    **{s: ("COMPARISON", s) for s in COMPARISONS},
+    **{s: ("LOGIC", s) for s in LOGIC},
+    **{s: (s, None) for s in PUNCT},
+}
+
+
+def classify(s):
+    """The (ttype, val) of a token with text s, or None if s isn't a token."""
+    fixed = FIXED_TOKENS.get(s)
+    if fixed is not None:
+        return fixed
+    elif re.fullmatch(INT_RE, s):
+        return "INT", int(s)
+    elif re.fullmatch(QUALIFIED_LABEL_RE, s):
+        return "LABEL", s
+
+    elif s.startswith('"'):
+        val = parse_string(s)
+        return ("STRING" if (val is not None) else None), val
+    elif s.startswith("'"):
+        _, val = parse_char(s[1:-1], 0)
+        return ("CHAR" if (val is not None) else None), val
+
+    return None
+
+
 class Token:
-    def __init__(self, line, line_no, col_no, s):
+    def __init__(self, line, line_no, col_no, s, kind=None):
+        """kind is the (ttype, val) classify gives s, if that is already known."""
         self.line = line
         self.line_no = line_no
         self.col_no = col_no
         self.s = s
-        self.val = None
-
-        if s == "INT":
-            self.ttype = "TYPE"
-            self.val = int
-        elif s == "BOOL":
-            self.ttype = "TYPE"
-            self.val = bool
-
-        elif s == "if":
-            self.ttype = "IF"
-        elif s == "then":
-            self.ttype = "THEN"
-        elif s == "else":
-            self.ttype = "ELSE"
-
-        elif s == "let":
-            self.ttype = "LET"
-        elif s == "in":
-            self.ttype = "IN"
-        elif s == "of":
-            self.ttype = "OF"
-
-        elif s == "true":
-            self.ttype = "BOOL"
-            self.val = True
-        elif s == "false":
-            self.ttype = "BOOL"
-            self.val = False
-        elif re.fullmatch(INT_RE, s):
-            self.ttype = "INT"
-            self.val = int(s)
-        elif re.fullmatch(LABEL_RE, s):
-            self.ttype = "LABEL"
-            self.val = s
-
-        elif s in BINOP_PRECS:
-            self.ttype = "BINOP"
-            self.val = s
-        elif s in COMPARISONS:
-            self.ttype = "COMPARISON"
-            self.val = s
-        elif s in LOGIC:
-            self.ttype = "LOGIC"
-            self.val = s
-
-        elif s in PUNCT:
-            self.ttype = s
-
-        elif s.startswith('"'):
-            val = parse_string(s)
-            self.ttype = "STRING" if (val is not None) else None
-            self.val = val
-        elif s.startswith("'"):
-            _, val = parse_char(s[1:-1], 0)
-            self.ttype = "CHAR" if (val is not None) else None
-            self.val = val
 
-        else:
-            self.raise_error("Bad token")
+        if kind is None:
+            kind = classify(s)
+            if kind is None:
+                self.ttype = self.val = None
+                self.raise_error("Bad token")
+        self.ttype, self.val = kind
 
     def __str__(self):
         return f"<Token line: {self.line_no}, col: {self.col_no}, s: {repr(self.s)}, type: {self.ttype}, value: {repr(self.val)}>"
@@ -121,11 +125,7 @@ class Token:
         return str(self)
 
     def raise_error(self, message):
-        s = self.line + "\n"
-        s += ' '*self.col_no + '^' + "\n"
-        s += f"(line {self.line_no + 1}, column {self.col_no + 1}) " + message
-        print(s)
-        sys.exit()
+        raise AzorError(self, message)
 
 
 ESCAPES = {
@@ -194,11 +194,22 @@ def grab_char_token(line):
     return f"'{c}'"
 
 
+def source_lines(lines):
+    """Lines as the tokenizer expects them, from any iterable of lines such as an open file."""
+    for line in lines:
+        yield line.rstrip("\n").replace('\t', '    ')
+
+
 class Tokenizer:
-    def __init__(self, lines):
+    def __init__(self, lines, first_line_no=0):
         self.lines = lines
+        self.first_line_no = first_line_no
 
     def grab_tokens(self, line_no, line):
+        for col_no, s in self.scan_line(line_no, line):
+            yield Token(line=line, line_no=line_no, col_no=col_no, s=s)
+
+    def scan_line(self, line_no, line):
         i = 0
         while i < len(line):
             rest = line[i:]
@@ -207,7 +218,7 @@ class Tokenizer:
                 continue
 
             elif re.match(LABEL_RE, rest):
-                s = re.match(LABEL_RE, rest).groups()[0]
+                s = re.match(QUALIFIED_LABEL_RE, rest).groups()[0]
 
             elif re.match(INT_RE, rest):
                 s = re.match(INT_RE, rest).groups()[0]
@@ -233,13 +244,27 @@ class Tokenizer:
             else:
                 s = rest[0]
 
-            token = Token(line=line, line_no=line_no, col_no=i, s=s)
-
+            yield i, s
             i += len(s)
-            yield token
+
+    def scan(self):
+        """
+        The (line_no, col_no, s, ttype, val) of every token, which are much cheaper than Tokens to send between
+        processes.
+        """
+        scanned = []
+        for line_no, line in enumerate(self.lines, self.first_line_no):
+            for col_no, s in self.scan_line(line_no, line):
+                kind = classify(s)
+                if kind is None:
+                    # a Token of it reports it as bad
+                    Token(line, line_no, col_no, s)
+                scanned.append((line_no, col_no, s, *kind))
+        return scanned
+
+    def iter_tokens(self):
+        for line_no, line in enumerate(self.lines, self.first_line_no):
+            yield from self.grab_tokens(line_no, line)
 
     def tokenize(self):
-        tokens = []
-        for line_no, line in enumerate(self.lines):
-            tokens += self.grab_tokens(line_no, line)
-        return tokens
+        return list(self.iter_tokens())
@@ -55,12 +55,20 @@ class LHS:
 
 
 class TypeChecker:
-    def __init__(self, stmts: List[Declaration]):
+    def __init__(self, stmts: List[Declaration], reserved: Set[str] = frozenset(),
+                 imported: Dict[str, AzorType] = None):
         self.stmts = stmts
-        self.symbol_table: Dict[str, AzorType] = {**SIDE_EFFECT_TYPES}
+        # names of declarations which exist but aren't being checked, which locals still can't shadow
+        self.reserved = reserved
+        # the types of names from imported modules, which are checked separately
+        self.symbol_table: Dict[str, AzorType] = {**SIDE_EFFECT_TYPES, **(imported or {})}
         self.stmts_by_label: Dict[str, Declaration] = {}
 
-    def check(self):
+        self.declarations_checked = 0
+        self.comparisons = 0
+
+    def check(self, require_main=True):
+        """Checks every declaration. Modules are checked without require_main, since they have no main."""
         for stmt in self.stmts:
             lhs = self.parselhs(stmt)
             if lhs.label in self.symbol_table:
@@ -68,16 +76,24 @@ class TypeChecker:
             self.symbol_table[lhs.label] = lhs.azortype
             self.stmts_by_label[lhs.label] = stmt
 
-        if "main" not in self.symbol_table:
+        if require_main and "main" not in self.symbol_table:
             self.raise_error(self.stmts[-1], "No main method defined")
 
         for label in self.stmts_by_label:
             self.checkstmt(label)
 
+        if not require_main:
+            return
+
+        self.comparisons += 1
         if self.symbol_table["main"] != MAIN_TYPE:
             self.raise_error(self.stmts_by_label["main"], "Main method must have type " + str(MAIN_TYPE))
 
+    def is_global(self, label):
+        return label in self.symbol_table or label in self.reserved
+
     def checkstmt(self, label):
+        self.declarations_checked += 1
         stmt = self.stmts_by_label[label]
         azortype = self.symbol_table[label]
 
@@ -92,7 +108,7 @@ class TypeChecker:
             for argname, argtype in zip(azortype.argnames, azortype.argtypes):
                 if argname in env:
                     self.raise_error(stmt, "Duplicate variable name: " + argname)
-                if argname in self.symbol_table:
+                if self.is_global(argname):
                     self.raise_error(stmt, "Variable shadows name from outer scope: " + argname)
 
                 env[argname] = argtype
@@ -118,6 +134,7 @@ class TypeChecker:
 
     def assert_expr(self, azortype: AzorType, expr: Expression, env: Dict[str, AzorType], generics: Set[str]):
         t = self.checkexpr(expr=expr, env=env, generics=generics)
+        self.comparisons += 1
         if t != azortype:
             self.raise_error(expr, f"Does not have expected type (expected {azortype}, got {t})")
 
@@ -199,7 +216,7 @@ class TypeChecker:
                     label = e.token.s
                     if label in subenv:
                         self.raise_error(e, "Duplicate variable name: " + label)
-                    elif label in self.symbol_table:
+                    elif self.is_global(label):
                         self.raise_error(e, "Shadows name from outer scope: " + label)
 
                 subenv[head.token.val] = ltype.etype
@@ -211,6 +228,7 @@ class TypeChecker:
 
             thentype = self.checkexpr(expr.left, subenv, generics)
             elsetype = self.checkexpr(expr.right, env, generics)
+            self.comparisons += 1
             if thentype != elsetype:
                 self.raise_error(expr, f"Then and else have different types: {str(thentype)} and {str(elsetype)}")
             return thentype
@@ -237,7 +255,7 @@ class TypeChecker:
 
                     if label in subenv:
                         self.raise_error(e, "Duplicate variable name: " + label)
-                    elif label in self.symbol_table:
+                    elif self.is_global(label):
                         self.raise_error(e, "Shadows name from outer scope: " + label)
 
                     subenv[label] = azortype
@@ -247,7 +265,7 @@ class TypeChecker:
 
                 if label in subenv:
                     self.raise_error(dest, "Duplicate variable name: " + label)
-                elif label in self.symbol_table:
+                elif self.is_global(label):
                     self.raise_error(dest, "Shadows name from outer scope: " + label)
 
                 subenv[label] = unpacked_type
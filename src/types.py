@@ -39,6 +39,14 @@ class AzorType:
                 argnames=self.argnames,
             )
 
+    def canonical(self):
+        """This type with its own generic parameters renamed by position, so that T(T) is the same as A(A)."""
+        if self.atype != "FUNCTION" or not self.generics:
+            return self
+        return self.resolve_generics({
+            label: AzorType("GENERIC", label=f"${i}") for i, label in enumerate(self.generics)
+        })
+
     def __eq__(self, other):
         if self.atype != other.atype:
             return False
@@ -72,6 +80,24 @@ class AzorType:
             return self.label
 
 
+def same_type(t1: AzorType, t2: AzorType):
+    """Like ==, but also requiring that tuples and argument lists have the same length."""
+    if t1.atype != t2.atype:
+        return False
+    elif t1.atype == "LIST":
+        return same_type(t1.etype, t2.etype)
+    elif t1.atype == "TUPLE":
+        return len(t1.constituents) == len(t2.constituents) and all(
+            same_type(c1, c2) for c1, c2 in zip(t1.constituents, t2.constituents)
+        )
+    elif t1.atype == "FUNCTION":
+        return same_type(t1.rtype, t2.rtype) and len(t1.argtypes) == len(t2.argtypes) and all(
+            same_type(a1, a2) for a1, a2 in zip(t1.argtypes, t2.argtypes)
+        )
+    else:
+        return t1 == t2
+
+
 BOOL = AzorType("BOOL")
 INT = AzorType("INT")
 NIL = AzorType("TUPLE", constituents=[])
@@ -85,3 +111,23 @@ PRINT_TYPE = AzorType("FUNCTION", rtype=NIL, argtypes=[INT_LIST])
 INPUT_TYPE = AzorType("FUNCTION", rtype=INT_LIST, argtypes=[])
 RAND_TYPE = AzorType("FUNCTION", rtype=INT, argtypes=[INT])
 MAIN_TYPE = AzorType("FUNCTION", rtype=INT, argtypes=[AzorType("LIST", etype=INT_LIST)], argnames=["args"])
+
+T = AzorType("GENERIC", label="T")
+A = AzorType("GENERIC", label="A")
+B = AzorType("GENERIC", label="B")
+T_LIST = AzorType("LIST", etype=T)
+A_LIST = AzorType("LIST", etype=A)
+
+LEN_TYPE = AzorType("FUNCTION", rtype=INT, argtypes=[T_LIST], generics=["T"])
+CONCAT_TYPE = AzorType("FUNCTION", rtype=T_LIST, argtypes=[T_LIST, T_LIST], generics=["T"])
+REVERSE_TYPE = AzorType("FUNCTION", rtype=T_LIST, argtypes=[T_LIST], generics=["T"])
+MAP_TYPE = AzorType("FUNCTION", rtype=AzorType("LIST", etype=B),
+                    argtypes=[AzorType("FUNCTION", rtype=B, argtypes=[A]), A_LIST], generics=["A", "B"])
+FILTER_TYPE = AzorType("FUNCTION", rtype=T_LIST,
+                       argtypes=[AzorType("FUNCTION", rtype=BOOL, argtypes=[T]), T_LIST], generics=["T"])
+FOLDL_TYPE = AzorType("FUNCTION", rtype=B,
+                      argtypes=[AzorType("FUNCTION", rtype=B, argtypes=[B, A]), B, A_LIST], generics=["A", "B"])
+FOLDR_TYPE = AzorType("FUNCTION", rtype=B,
+                      argtypes=[AzorType("FUNCTION", rtype=B, argtypes=[A, B]), B, A_LIST], generics=["A", "B"])
+SUM_TYPE = AzorType("FUNCTION", rtype=INT, argtypes=[INT_LIST])
+NTH_TYPE = AzorType("FUNCTION", rtype=T, argtypes=[T_LIST, INT, T], generics=["T"])
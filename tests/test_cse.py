@@ -0,0 +1,30 @@
+import io
+import os
+import unittest
+
+from src.program import compile, STDLIB_PATH
+
+REBOUND = """
+sq : INT(n : INT) = n * n
+
+pick : INT(d : BOOL) = (if d then (let x <- 1 in sq(x) + 0) else (let x <- 2 in sq(x) + 0)) + (let x <- 5 in 0)
+
+main : INT() = let _ <- print(show(pick(false))) in 0
+"""
+
+
+@unittest.skipUnless(os.path.exists(STDLIB_PATH), "needs the stdlib from the azor submodule")
+class CommonSubexpressionTest(unittest.TestCase):
+    def output(self, source, cse):
+        out = io.StringIO()
+        compile(source, cse=cse).run(stdout=out)
+        return out.getvalue()
+
+    def test_name_bound_in_several_branches(self):
+        # the same sq(x) appears in both branches, each under its own x, so it must not be hoisted above either
+        self.assertEqual(self.output(REBOUND, cse=True), "4")
+        self.assertEqual(self.output(REBOUND, cse=False), "4")
+
+
+if __name__ == "__main__":
+    unittest.main()
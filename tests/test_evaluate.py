@@ -0,0 +1,25 @@
+import os
+import unittest
+
+from src.evaluate import Interpreter
+from src.program import compile, STDLIB_PATH
+
+KEEP = """
+big : BOOL(n : INT) = n > 90000
+
+keep : [INT](l : [INT]) = if h ~ t <- l then (if big(h) then h ~ keep(t) else keep(t)) else [] of INT
+
+main : INT() = len{INT}(keep(range(0, 100000)))
+"""
+
+
+@unittest.skipUnless(os.path.exists(STDLIB_PATH), "needs the stdlib from the azor submodule")
+class ConsLoopTest(unittest.TestCase):
+    def test_skipped_elements_run_in_constant_stack(self):
+        # without the fused calls, so that keep's own recursion is what's run
+        program = compile(KEEP)
+        self.assertEqual(Interpreter(program.stmts, program.natives()).main([]), 9999)
+
+
+if __name__ == "__main__":
+    unittest.main()
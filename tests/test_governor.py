@@ -0,0 +1,25 @@
+import os
+import unittest
+
+from src.governor import Limits, ResourceLimitExceeded
+from src.program import compile, STDLIB_PATH
+
+GROW = """
+grow : [INT](l : [INT]) = if len{INT}(l) > 1000000 then l else grow(concat{INT}(l, l))
+
+main : INT() = len{INT}(grow([1]))
+"""
+
+
+@unittest.skipUnless(os.path.exists(STDLIB_PATH), "needs the stdlib from the azor submodule")
+class LimitsTest(unittest.TestCase):
+    def test_native_lists_are_charged(self):
+        program = compile(GROW)
+        self.assertEqual(program.run(), 1 << 20)
+        with self.assertRaises(ResourceLimitExceeded) as caught:
+            program.run(limits=Limits(max_cells=1000))
+        self.assertEqual(caught.exception.limit, "cells")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import os
+import tempfile
+import unittest
+
+from src.modules import CACHE_DIR
+from src.program import compile, STDLIB_PATH
+
+UTIL = """
+quad : INT(x : INT) = x * 4
+"""
+
+MAIN = """
+import util
+
+main : INT() = util.quad(10)
+"""
+
+
+@unittest.skipUnless(os.path.exists(STDLIB_PATH), "needs the stdlib from the azor submodule")
+class ModuleCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, "util.azor"), "w") as fh:
+            fh.write(UTIL)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_compile_leaves_the_working_directory_alone(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        try:
+            self.assertEqual(compile(MAIN).run(), 40)
+        finally:
+            os.chdir(cwd)
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, CACHE_DIR)))
+
+    def test_compile_caches_in_a_given_directory(self):
+        self.assertEqual(compile(MAIN, directory=self.directory.name).run(), 40)
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, CACHE_DIR)))
+
+
+if __name__ == "__main__":
+    unittest.main()
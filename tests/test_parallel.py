@@ -0,0 +1,41 @@
+import math
+import os
+import unittest
+
+from src.analysis import ProgramAnalysis
+from src.evaluate import Interpreter
+from src.parallel import ParallelInterpreter
+from src.program import compile, STDLIB_PATH
+
+SMALL = """
+small : INT(n : INT) = if n <= 0 then 0 else 1 + small(n - 1)
+
+loop : INT(i : INT) = if i <= 0 then 0 else (let n <- small(2) + small(3) in n + loop(i - 1))
+
+main : INT() = loop(30)
+"""
+
+
+@unittest.skipUnless(os.path.exists(STDLIB_PATH), "needs the stdlib from the azor submodule")
+class ParallelInterpreterTest(unittest.TestCase):
+    def test_recursive_cost_is_bounded(self):
+        program = compile(SMALL)
+        self.assertLess(ProgramAnalysis(program.stmts).declaration_cost("small"), math.inf)
+
+    def test_counts_match_sequential_run(self):
+        program = compile(SMALL)
+        sequential = Interpreter(program.stmts, program.natives())
+        parallel = ParallelInterpreter(program.stmts, program.natives(), workers=2)
+        self.assertEqual(parallel.main([]), sequential.main([]))
+        self.assertEqual((parallel.steps, parallel.peak_depth), (sequential.steps, sequential.peak_depth))
+
+    def test_cheap_fork_points_stop_forking(self):
+        program = compile(SMALL)
+        parallel = ParallelInterpreter(program.stmts, program.natives(), workers=2)
+        parallel.main([])
+        self.assertEqual(len(parallel.costs), 1)
+        self.assertLess(*parallel.costs.values(), parallel.min_cost)
+
+
+if __name__ == "__main__":
+    unittest.main()
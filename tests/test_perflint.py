@@ -0,0 +1,31 @@
+import os
+import unittest
+
+from src.program import compile, STDLIB_PATH
+from src.perflint import lint_program, QUADRATIC
+
+PAIRS = """
+drop : [INT](l : [INT]) = if h ~ t <- l then t else l
+
+pairs : INT(l : [INT]) = if len{INT}(l) > 1 then len{INT}(l) + pairs(drop(l)) else 0
+
+main : INT(args : [[INT]]) = pairs(range(0, 10))
+"""
+
+
+@unittest.skipUnless(os.path.exists(STDLIB_PATH), "needs the stdlib from the azor submodule")
+class PerformanceLinterTest(unittest.TestCase):
+    def test_len_in_recursive_guard(self):
+        # CSE would hoist both len calls into a let, hiding the one in the condition
+        findings = lint_program(compile(PAIRS, prune=False, cse=False), native=False)
+        self.assertEqual(
+            [(f.label, f.token.line_no + 1, f.token.col_no + 1, f.complexity) for f in findings],
+            [("pairs", 4, 29, QUADRATIC)],
+        )
+
+    def test_native_len_is_constant_time(self):
+        self.assertEqual(lint_program(compile(PAIRS, prune=False, cse=False)), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,26 @@
+import os
+import unittest
+
+from src.program import compile, STDLIB_PATH
+from src.sampler import SamplingInterpreter
+
+COUNT = """
+count : INT(n : INT) = if n <= 0 then (let _ <- print("done") in 0) else 1 + count(n - 1)
+
+main : INT() = count(50)
+"""
+
+
+@unittest.skipUnless(os.path.exists(STDLIB_PATH), "needs the stdlib from the azor submodule")
+class SamplingInterpreterTest(unittest.TestCase):
+    def test_recursion_is_one_frame(self):
+        program = compile(COUNT)
+        interpreter = SamplingInterpreter(program.stmts, program.natives())
+        stacks = []
+        interpreter.symbol_table["print"] = lambda nums: stacks.append(list(interpreter.stack))
+        self.assertEqual(interpreter.main([]), 50)
+        self.assertEqual(stacks, [["main:4", "count:2"]])
+
+
+if __name__ == "__main__":
+    unittest.main()